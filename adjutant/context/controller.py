@@ -1,6 +1,6 @@
 """ Context for the controller """
 
-from typing import List
+from typing import Any, Dict, List, Tuple
 import logging
 from PyQt6.QtCore import QModelIndex, QObject, Qt
 from PyQt6.QtWidgets import QApplication, QInputDialog, QMessageBox
@@ -11,13 +11,37 @@ from adjutant.context.signal_context import SignalContext
 from adjutant.context.model_context import ModelContext
 from adjutant.context.database_context import (
     DatabaseContext,
+    INTERNAL_FIELDS,
+    copy_rows,
+    copy_tags_to_bases,
+    delete_where_in,
     generate_uuid,
-    remove_all_tags_for_base,
+    get_ids_where_in,
+    set_tags_for_bases,
+    update_where_in,
     remove_scheme_components,
 )
-from adjutant.context.dataclasses import SchemeComponent, Tag
+from adjutant.context.dataclasses import RowChanges, SchemeComponent, Tag
+from adjutant.context.exceptions import TransactionFailed
 from adjutant.models.relational_model import RelationalModel
 
+# Rows of other tables deleted together with a record, as (table, foreign key,
+# the record's field it refers to)
+DEPENDENT_ROWS = {
+    "bases": [("bases_tags", "bases_key", "key")],
+    "tags": [("bases_tags", "tags_key", "key")],
+    "recipes": [("recipe_steps", "recipes_id", "id")],
+    "colour_schemes": [("scheme_components", "schemes_id", "id")],
+    "step_operations": [("recipe_steps", "operations_id", "id")],
+}
+
+# Fields of other tables referring to a record, as (table, field)
+REFERENCES = {
+    "statuses": [("bases", "status_id")],
+    "storages": [("bases", "storages_id")],
+    "colour_schemes": [("bases", "schemes_id")],
+}
+
 
 class Controller(QObject):
     """Controller Context"""
@@ -73,6 +97,12 @@ class Controller(QObject):
         model.setData(index, name)
         model.submitAll()
 
+    def revert_models(self, *models: RelationalModel) -> None:
+        """Discard pending changes and reload models after a rolled back transaction"""
+        for model in models:
+            model.revertAll()
+            model.select()
+
     def confirm_deletion(self, indexes: List[QModelIndex], desc: str) -> bool:
         """Asks user to confirm deletion"""
         result = QMessageBox.warning(
@@ -90,11 +120,54 @@ class Controller(QObject):
         """Removes records from the model with confirmation"""
         if not self.confirm_deletion(indexes, desc):
             return
-        for index in indexes:
-            model.removeRow(index.row())
-        model.submitAll()
-        model.select()
-        model.updateRowCount()
+        table = model.tableName()
+        ids = list(dict.fromkeys(index.siblingAtColumn(0).data() for index in indexes))
+        try:
+            with self.database.transaction():
+                changes = self._reassign_references(table, ids, "")
+                for child, field, key in DEPENDENT_ROWS.get(table, []):
+                    keys = get_ids_where_in(self.database, table, "id", ids, key)
+                    child_ids = get_ids_where_in(self.database, child, field, keys)
+                    if not delete_where_in(self.database, child, field, keys):
+                        raise TransactionFailed(f"Failed to delete from {child}")
+                    changes.setdefault(child, RowChanges()).deleted.extend(child_ids)
+                if not delete_where_in(self.database, table, "id", ids):
+                    raise TransactionFailed(f"Failed to delete from {table}")
+        except TransactionFailed as exc:
+            logging.error("Failed to delete %s: %s", desc, exc)
+            return
+        changes.setdefault(table, RowChanges()).deleted.extend(ids)
+        self.apply_changes(changes)
+
+    def reassign_references(
+        self, table: str, old_ids: List[Any], new_id: Any = ""
+    ) -> bool:
+        """Point everything that refers to the old records at the new one"""
+        try:
+            with self.database.transaction():
+                changes = self._reassign_references(table, old_ids, new_id)
+        except TransactionFailed as exc:
+            logging.error("Failed to reassign references to %s: %s", table, exc)
+            return False
+        self.apply_changes(changes)
+        return True
+
+    def _reassign_references(
+        self, table: str, old_ids: List[Any], new_id: Any
+    ) -> Dict[str, RowChanges]:
+        """Update the referring fields, returning the rows changed per table"""
+        changes: Dict[str, RowChanges] = {}
+        for child, field in REFERENCES.get(table, []):
+            child_ids = get_ids_where_in(self.database, child, field, old_ids)
+            if not update_where_in(self.database, child, field, new_id, field, old_ids):
+                raise TransactionFailed(f"Failed to reassign {child}.{field}")
+            changes.setdefault(child, RowChanges()).updated.extend(child_ids)
+        return changes
+
+    def apply_changes(self, changes: Dict[str, RowChanges]) -> None:
+        """Apply the changed rows of each table to the models"""
+        for table, table_changes in changes.items():
+            self.models.apply_changes(table, table_changes)
 
     def set_font_size(self, font_size: int):
         """Set the applications font size"""
@@ -110,17 +183,49 @@ class Controller(QObject):
         self.settings.font_size = font_size
         self.settings.save()
 
+    def set_database_profile(self, profile: str):
+        """Set the database performance profile"""
+        self.database.apply_profile(profile)
+        self.settings.database_profile = profile
+        self.settings.save()
+
     def duplicate_base(self, index: QModelIndex, num: int) -> bool:
         """Duplicate the given base num times"""
         index = self.convert_index(index)
-        for _ in range(num):
-            record = self.models.bases_model.record(index.row())
-            record.setValue("id", generate_uuid())
-            self.models.bases_model.insertRecord(-1, record)
-        success = self.models.bases_model.submitAll()
-        if not success:
-            return False
-        return self.duplicate_tags(index, num)
+        if num <= 0:
+            return True
+        return bool(self.duplicate_bases([index.siblingAtColumn(0).data()], num))
+
+    def duplicate_bases(self, base_ids: List[Any], num: int) -> List[Any]:
+        """
+        Copy each of the bases num times, together with their tags. Returns the
+        IDs of the copies, or an empty list if copying failed.
+        """
+        copies = [
+            (generate_uuid(), base_id) for base_id in base_ids for _ in range(num)
+        ]
+        if not copies:
+            return []
+        record = self.models.bases_model.record()
+        fields = [
+            record.fieldName(x)
+            for x in range(1, record.count())
+            if record.fieldName(x) not in INTERNAL_FIELDS
+        ]
+        try:
+            with self.database.transaction():
+                if not copy_rows(self.database, "bases", fields, copies):
+                    raise TransactionFailed("Failed to copy bases")
+                if not self.duplicate_tags(copies):
+                    raise TransactionFailed("Failed to copy tags")
+        except TransactionFailed as exc:
+            logging.error("Failed to duplicate base: %s", exc)
+            return []
+        new_ids = [new_id for new_id, _ in copies]
+        self.models.apply_changes("bases", RowChanges(inserted=new_ids))
+        # Copied tag uses get no IDs of their own to apply
+        self.models.base_tags_model.select()
+        return new_ids
 
     def create_tag(self, default=""):
         """Create a new tag"""
@@ -138,51 +243,65 @@ class Controller(QObject):
 
     def apply_field_to_bases(self, source: QModelIndex, destination: List[QModelIndex]):
         """Apply the data from the source index to the same field in the destination list"""
-        for index in destination:
-            index = self.convert_index(index)
-            self.models.bases_model.setData(
-                index.siblingAtColumn(source.column()),
-                source.data(Qt.ItemDataRole.EditRole),
-            )
-        self.models.bases_model.submitAll()
-
-    def add_tags(self, index: QModelIndex, tags: List[int]):
+        ids = [self.convert_index(x).siblingAtColumn(0).data() for x in destination]
+        self.models.bases_model.apply_field(
+            source.column(), source.data(Qt.ItemDataRole.EditRole), ids
+        )
+
+    def add_tags(self, index: QModelIndex, tags: List[int]) -> bool:
         """Add the tags to the given base"""
         model = self.models.base_tags_model
+        base_id = index.siblingAtColumn(0).data()
+        existing = {tag.tag_id for tag in self.models.bases_model.cached_tags(base_id)}
+        tags = [tag for tag in dict.fromkeys(tags) if tag not in existing]
+        try:
+            with self.database.transaction():
+                for tag in tags:
+                    record = model.record()
+                    record.setValue("id", generate_uuid())
+                    record.setValue("bases_id", base_id)
+                    record.setValue("tags_id", tag)
+                    model.insertRecord(-1, record)
+                if not model.submitAll():
+                    raise TransactionFailed(model.lastError().text())
+        except TransactionFailed as exc:
+            logging.error("Failed to add tags to base %s: %s", base_id, exc)
+            self.revert_models(model)
+            return False
+
+        cached = list(self.models.bases_model.cached_tags(base_id))
         for tag in tags:
-            record = model.record()
-            record.setValue("id", generate_uuid())
-            record.setValue("bases_id", index.siblingAtColumn(0).data())
-            record.setValue("tags_id", tag)
-            model.insertRecord(-1, record)
-        model.submitAll()
+            name = self.models.tags_model.record_by_id(tag).value("name")
+            cached.append(Tag(tag, name))
+        self.models.bases_model.set_cached_tags(base_id, cached)
         self.signals.tags_updated.emit(index)
+        return True
 
     def remove_tags(self, index: QModelIndex, _: List[int]):
         """Remome tags"""
         self.signals.tags_updated.emit(index)
 
-    def set_tags(self, index: QModelIndex, tags: List[int]):
-        """Remove all tags and set to parameter"""
-        # Remove all tags
+    def set_tags(self, index: QModelIndex, tags: List[int]) -> bool:
+        """Set the base's tags, only adding and removing the ones that changed"""
         base_id = index.siblingAtColumn(0).data()
-        remove_all_tags_for_base(self.database, base_id)
-        self.models.base_tags_model.select()
-
-        self.add_tags(index, tags)
+        try:
+            with self.database.transaction():
+                if not set_tags_for_bases(self.database, [base_id], tags):
+                    raise TransactionFailed(f"Failed to set tags for {base_id}")
+        except TransactionFailed as exc:
+            logging.error(exc)
+            return False
 
-    def duplicate_tags(self, index: QModelIndex, num: int) -> bool:
-        """Updates the same tags on the last 'num' rows same as index"""
-        tag_column = self.models.bases_model.columnCount() - 1
-        tags: List[Tag] = index.siblingAtColumn(tag_column).data(
-            Qt.ItemDataRole.EditRole
-        )
+        names = [self.models.tags_model.record_by_id(x).value("name") for x in tags]
+        model = self.models.bases_model
+        wanted = [Tag(tag, name) for tag, name in zip(tags, names)]
+        model.set_cached_tags(base_id, model.tag_index.updated_tags(base_id, wanted))
+        self.signals.tags_updated.emit(index)
+        return True
 
-        num_rows = self.models.bases_model.rowCount()
-        for step in range(num):
-            idx = self.models.bases_model.index(num_rows - 1 - step, tag_column)
-            self.models.bases_model.setData(idx, tags)
-        return self.models.bases_model.submitAll()
+    def duplicate_tags(self, copies: List[Tuple[Any, Any]]) -> bool:
+        """Copies the tags of the source bases, given as (new ID, source ID) pairs"""
+        return copy_tags_to_bases(self.database, copies)
 
     def delete_search(self, index: QModelIndex):
         """Delete the given search"""
@@ -210,42 +329,33 @@ class Controller(QObject):
         )
 
     def delete_status(self, index: QModelIndex):
-        """Delete a status"""
-        old_status = index.siblingAtColumn(0).data()
+        """Delete a status, resetting the status of bases that had it"""
         self.delete_records(self.models.statuses_model, [index], "status")
 
-        for row in range(self.models.bases_model.rowCount()):
-            index = self.models.bases_model.index(
-                row, self.models.bases_model.fieldIndex("status_id")
-            )
-            if index.data(Qt.ItemDataRole.EditRole) == old_status:
-                self.models.bases_model.setData(index, "")
-
     def delete_paints(self, indexes: List[QModelIndex]):
         """Deletes a given paint"""
         self.delete_records(self.models.paints_model, indexes, "paint")
 
     def delete_recipes(self, indexes: List[QModelIndex]):
         """Deleted a given colour recipe"""
-        for index in indexes:
-            recipe_id = index.siblingAtColumn(0).data()
-            self.delete_recipe_steps(recipe_id)
         self.delete_records(self.models.recipes_model, indexes, "colour recipe")
 
     def delete_recipe_steps(self, recipe_id: int):
         """Add a new recipe step"""
-        model = self.models.recipe_steps_model
-        for row in range(model.rowCount()):
-            record = model.record(row)
-            if record.value("recipes_id") == recipe_id:
-                model.removeRow(row)
-        model.submitAll()
+        ids = get_ids_where_in(self.database, "recipe_steps", "recipes_id", [recipe_id])
+        try:
+            with self.database.transaction():
+                if not delete_where_in(
+                    self.database, "recipe_steps", "recipes_id", [recipe_id]
+                ):
+                    raise TransactionFailed("Failed to delete from recipe_steps")
+        except TransactionFailed as exc:
+            logging.error("Failed to delete steps for recipe %s: %s", recipe_id, exc)
+            return
+        self.models.apply_changes("recipe_steps", RowChanges(deleted=ids))
 
     def delete_schemes(self, indexes: List[QModelIndex]):
         """Deleted a given colour recipe"""
-        for index in indexes:
-            scheme_id = index.siblingAtColumn(0).data()
-            self.replace_scheme_components(scheme_id, [])
         self.delete_records(self.models.colour_schemes_model, indexes, "colour scheme")
 
     def replace_scheme_components(
@@ -253,16 +363,22 @@ class Controller(QObject):
     ):
         """Add a new recipe step"""
         model = self.models.scheme_components_model
-        remove_scheme_components(self.database, scheme_id)
-        model.select()
-        for component in components:
-            record = model.record()
-            record.setValue("id", generate_uuid())
-            record.setValue("schemes_id", scheme_id)
-            record.setValue("name", component.name)
-            record.setValue("recipes_id", component.recipe_id)
-            model.insertRecord(-1, record)
-        model.submitAll()
+        try:
+            with self.database.transaction():
+                if not remove_scheme_components(self.database, scheme_id):
+                    raise TransactionFailed(f"Failed to remove components {scheme_id}")
+                for component in components:
+                    record = model.record()
+                    record.setValue("id", generate_uuid())
+                    record.setValue("schemes_id", scheme_id)
+                    record.setValue("name", component.name)
+                    record.setValue("recipes_id", component.recipe_id)
+                    model.insertRecord(-1, record)
+                if not model.submitAll():
+                    raise TransactionFailed(model.lastError().text())
+        except TransactionFailed as exc:
+            logging.error("Failed to replace scheme components: %s", exc)
+            self.revert_models(model)
 
     def create_operation(self):
         """Creates a new operation"""
@@ -277,18 +393,9 @@ class Controller(QObject):
         )
 
     def delete_operation(self, index: QModelIndex):
-        """Delete an operation"""
-        old_operation = index.siblingAtColumn(0).data()
+        """Delete an operation and the recipe steps using it"""
         self.delete_records(self.models.step_operations_model, [index], "operation")
 
-        for row in range(self.models.recipe_steps_model.rowCount()):
-            index = self.models.recipe_steps_model.index(
-                row, self.models.recipe_steps_model.fieldIndex("operations_id")
-            )
-            if index.data(Qt.ItemDataRole.EditRole) == old_operation:
-                self.models.recipe_steps_model.removeRow(row)
-        self.models.recipe_steps_model.submitAll()
-
     def load_latest_version(self, callback):
         """Load version from github repo"""
         url = "https://raw.githubusercontent.com/pkuehne/adjutant/main/adjutant/context/version.py"
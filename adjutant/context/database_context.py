@@ -1,26 +1,103 @@
 """ Classes to manage database operations """
 
 import logging
+import os
+import time
 import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Dict, Iterator, List, Tuple
 from dataclasses import dataclass
+import yaml
 from PyQt6.QtSql import QSqlDatabase, QSqlQuery
 
 from adjutant.context.dataclasses import Tag
-from adjutant.context.database_migrations import LATEST_DATABASE_VERSION, VERSION_1
+from adjutant.context.database_migrations import (
+    LATEST_DATABASE_VERSION,
+    VERSION_1,
+    VERSION_2,
+    VERSION_3,
+    VERSION_3_TRIGGERS,
+    VERSION_4,
+    VERSION_4_TRIGGERS,
+)
 from adjutant.context.exceptions import (
     DatabaseIsNewer,
     DatabaseNeedsMigration,
     NoDatabaseFileFound,
+    TransactionFailed,
 )
 
 DATABASE_FILE = Path(".") / "adjutant.db"
+STATEMENT_CACHE_SIZE = 64
+# Values bound per IN (...) list, well below SQLite's limit on bound parameters
+IN_CHUNK_SIZE = 500
+# Integer keys used for joins within the database, the UUID in the id field
+# identifies records outside of it
+INTERNAL_FIELDS = ["key", "bases_key", "tags_key"]
+# Index of the tags column in saved searches from before the bases key
+PRE_KEY_BASES_TAGS_COLUMN = 22
+# Bounds of ISO-8601 dates, a range between them skips unknown dates
+EARLIEST_DATE = "0001-01-01"
+LATEST_DATE = "9999-12-31"
+
+DEFAULT_DATABASE_PROFILE = "fast"
+DATABASE_PROFILES: Dict[str, Dict[str, Any]] = {
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,  # 2MB
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,  # 64MB
+        "mmap_size": 268435456,  # 256MB
+        "temp_store": "MEMORY",
+    },
+}
+
+
+class TimeOrderedIds:
+    """
+    Generates version 7 UUIDs: 48 bits of Unix time in milliseconds followed
+    by random bits. New IDs sort after older ones, so inserts append to the
+    end of the primary key index instead of landing on random pages. They
+    have the same format as the version 4 UUIDs of existing rows.
+    """
+
+    last = 0
+
+    @classmethod
+    def generate(cls) -> uuid.UUID:
+        """Returns an ID that sorts after every one generated before"""
+        # 48 bits of time and 74 random bits, counted on within a millisecond
+        millis = time.time_ns() // 1_000_000
+        payload = (millis << 74) | (int.from_bytes(os.urandom(10), "big") >> 6)
+        payload = max(payload, cls.last + 1)
+        cls.last = payload
+        value = (payload >> 74) << 80
+        value |= 0x7 << 76  # Version 7
+        value |= ((payload >> 62) & 0xFFF) << 64
+        value |= 0x2 << 62  # RFC 4122 variant
+        value |= payload & ((1 << 62) - 1)
+        return uuid.UUID(int=value)
 
 
-def generate_uuid() -> str:
+DEFAULT_ID_GENERATOR = "time_ordered"
+ID_GENERATORS = {
+    "random": uuid.uuid4,
+    "time_ordered": TimeOrderedIds.generate,
+}
+
+
+def generate_uuid(generator: str = DEFAULT_ID_GENERATOR) -> str:
     """Generates a 36 char hex string that should be unique"""
-    return str(uuid.uuid4())
+    return str(ID_GENERATORS[generator]())
 
 
 @dataclass
@@ -31,17 +108,74 @@ class QueryBinding:
     value: Any
 
 
+class StatementCache:
+    """Bounded LRU cache of prepared queries, keyed by their SQL text"""
+
+    # Caches per connection, so all their queries can be finished at once
+    caches: Dict[str, "weakref.WeakSet[StatementCache]"] = {}
+
+    def __init__(self, database: QSqlDatabase, size: int = STATEMENT_CACHE_SIZE):
+        self.database = database
+        self.size = size
+        self.statements: OrderedDict[str, QSqlQuery] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        StatementCache.caches.setdefault(
+            database.connectionName(), weakref.WeakSet()
+        ).add(self)
+
+    def get(self, command: str) -> QSqlQuery:
+        """Returns a prepared query for the command, re-using a cached one if possible"""
+        query = self.statements.get(command, None)
+        if query is not None:
+            self.statements.move_to_end(command)
+            self.hits += 1
+            return query
+
+        self.misses += 1
+        query = QSqlQuery(self.database)
+        if not query.prepare(command):
+            # Don't cache failures, executing will report the error
+            return query
+        self.statements[command] = query
+        if len(self.statements) > self.size:
+            _, evicted = self.statements.popitem(last=False)
+            evicted.finish()
+        return query
+
+    def clear(self) -> None:
+        """Release all prepared queries"""
+        self.finish()
+        self.statements.clear()
+
+    def finish(self) -> None:
+        """Reset all queries that are still active, keeping them prepared"""
+        for query in self.statements.values():
+            query.finish()
+
+    @classmethod
+    def finish_all(cls, connection: str) -> None:
+        """Reset the active queries of every cache using the connection"""
+        for cache in list(cls.caches.get(connection, ())):
+            cache.finish()
+
+
 class DatabaseContext:
     """Manage connection to the database"""
 
+    # Open transactions per connection, shared by all contexts using it
+    transaction_depth: Dict[str, int] = {}
+
     def __init__(self) -> None:
         self.database = QSqlDatabase.database()
         if not self.database.isValid():
             # Create the global database connection if one doesn't exist already
             self.database = QSqlDatabase.addDatabase("QSQLITE")
+        self.statements = StatementCache(self.database)
 
-    def open_database(self) -> None:
+    def open_database(self, profile: str = DEFAULT_DATABASE_PROFILE) -> None:
         """Open the database for operations"""
+        self.statements.clear()
         if self.database.isOpen():
             self.database.close()
 
@@ -49,6 +183,7 @@ class DatabaseContext:
         if not self.database.open():
             logging.error("Failed to open database: %s", DATABASE_FILE)
             raise RuntimeError("Failed to open the database")
+        self.apply_profile(profile)
         if self.version() == 0:
             logging.info("Database version is 0")
             raise NoDatabaseFileFound()
@@ -68,6 +203,32 @@ class DatabaseContext:
 
         # Versions match
 
+    def apply_profile(self, profile: str) -> None:
+        """Apply the named set of performance pragmas to the open database"""
+        pragmas = DATABASE_PROFILES.get(profile, None)
+        if pragmas is None:
+            logging.warning(
+                "Unknown database profile %s, using %s",
+                profile,
+                DEFAULT_DATABASE_PROFILE,
+            )
+            pragmas = DATABASE_PROFILES[DEFAULT_DATABASE_PROFILE]
+        # Unfinished SELECTs keep a read transaction open, in which SQLite
+        # refuses to change the journal mode
+        StatementCache.finish_all(self.database.connectionName())
+        for pragma, value in pragmas.items():
+            result = self.execute_sql_command(
+                f"PRAGMA {pragma} = {value};", errors=pragma != "journal_mode"
+            )
+            if result:
+                result.finish()
+            elif pragma == "journal_mode":
+                # Rows still being fetched by a model keep the transaction open
+                logging.info(
+                    "Journal mode %s applies when the database is next opened",
+                    value,
+                )
+
     def version(self) -> int:
         """The version of the database"""
         result = self.execute_sql_command("SELECT version FROM settings", errors=False)
@@ -88,6 +249,21 @@ class DatabaseContext:
                 self.execute_sql_command(
                     f"INSERT INTO {table}(id, name) VALUES ('', '<None>');"
                 )
+        if self.version() < 2:
+            # Migrate from version 1 to 2
+            self.execute_sql_string(VERSION_2)
+            self.execute_sql_command("ANALYZE;")
+        if self.version() < 3:
+            # Migrate from version 2 to 3
+            with self.transaction():
+                self._rebuild_tables(VERSION_3, VERSION_3_TRIGGERS)
+                self._shift_search_columns(PRE_KEY_BASES_TAGS_COLUMN, 1)
+            self.execute_sql_command("ANALYZE;")
+        if self.version() < 4:
+            # Migrate from version 3 to 4
+            with self.transaction():
+                self._rebuild_tables(VERSION_4, VERSION_4_TRIGGERS)
+            self.execute_sql_command("ANALYZE;")
 
         # Database migrated to latest version
         self.execute_sql_command(
@@ -95,13 +271,77 @@ class DatabaseContext:
         )
         logging.info("Database migration complete")
 
+    def _rebuild_tables(self, migration: str, triggers: List[str]) -> None:
+        """Run a migration that replaces tables, then create its triggers"""
+        statements = [x for x in migration.split(";") if x.strip()]
+        # Tables can't be dropped while any statement is still active
+        self.statements.clear()
+        for statement in statements + triggers:
+            if not self.execute_sql_command(statement):
+                raise TransactionFailed("Failed to rebuild the tables")
+
+    def _shift_search_columns(self, first: int, offset: int) -> None:
+        """Move the column filters of saved searches from first onwards"""
+        result = self.execute_sql_command("SELECT id, encoded FROM searches;")
+        searches = []
+        while result and result.next():
+            searches.append((result.value("id"), result.value("encoded")))
+        for search_id, encoded in searches:
+            filters = yaml.safe_load(encoded) or {}
+            column_filters = filters.get("column_filters") or {}
+            filters["column_filters"] = {
+                (column + offset if column >= first else column): values
+                for column, values in column_filters.items()
+            }
+            bindings = [
+                QueryBinding(":id", search_id),
+                QueryBinding(":encoded", yaml.dump(filters)),
+            ]
+            query = "UPDATE searches SET encoded = :encoded WHERE id = :id;"
+            if not self.execute_sql_command(query, bindings):
+                raise TransactionFailed("Failed to update saved searches")
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Runs the enclosed block in a single transaction. Nested blocks use
+        savepoints, so an inner failure only rolls back the inner block.
+        Any exception rolls back and is re-raised.
+        """
+        connection = self.database.connectionName()
+        depth = DatabaseContext.transaction_depth.get(connection, 0)
+        savepoint = f"savepoint_{depth}"
+        if depth == 0:
+            if not self.database.transaction():
+                raise TransactionFailed(self.database.lastError().text())
+        elif not self.execute_sql_command(f"SAVEPOINT {savepoint}"):
+            raise TransactionFailed(f"Failed to create {savepoint}")
+
+        DatabaseContext.transaction_depth[connection] = depth + 1
+        try:
+            yield
+        except Exception:
+            DatabaseContext.transaction_depth[connection] = depth
+            if depth == 0:
+                self.database.rollback()
+            else:
+                self.execute_sql_command(f"ROLLBACK TO {savepoint}")
+                self.execute_sql_command(f"RELEASE {savepoint}")
+            raise
+        DatabaseContext.transaction_depth[connection] = depth
+        if depth == 0:
+            if not self.database.commit():
+                self.database.rollback()
+                raise TransactionFailed(self.database.lastError().text())
+        elif not self.execute_sql_command(f"RELEASE {savepoint}"):
+            raise TransactionFailed(f"Failed to release {savepoint}")
+
     def execute_sql_command(
         self, command: str, bindings: List[QueryBinding] = None, errors: bool = True
     ) -> QSqlQuery:
         """Execute a SQL command"""
         bindings = bindings if bindings else []
-        query = QSqlQuery(self.database)
-        query.prepare(command)
+        query = self.statements.get(command)
         for binding in bindings:
             query.bindValue(binding.placeholder, binding.value)
         if not query.exec():
@@ -124,9 +364,135 @@ class DatabaseContext:
             self.execute_sql_command(query)
 
 
+def sql_literal(value: Any) -> str:
+    """Formats a value as a SQL literal, for clauses that can't use bindings"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    text = str(value).replace("'", "''")
+    return f"'{text}'"
+
+
+def range_clause(field: str, minimum: Any = None, maximum: Any = None) -> str:
+    """Formats an inclusive range as a SQL condition, open where a bound is None"""
+    clauses = []
+    if any(isinstance(bound, (int, float)) for bound in (minimum, maximum)):
+        # SQLite sorts text above any number, so '' would pass a minimum
+        clauses.append(f"typeof({field}) IN ('integer', 'real')")
+    if minimum is not None:
+        clauses.append(f"{field} >= {sql_literal(minimum)}")
+    if maximum is not None:
+        clauses.append(f"{field} <= {sql_literal(maximum)}")
+    return " AND ".join(clauses) if clauses else f"{field} IS NOT NULL"
+
+
+def in_list_chunks(values: List[Any]) -> Iterator[Tuple[str, List[QueryBinding]]]:
+    """Yields (placeholders, bindings) for IN lists of at most IN_CHUNK_SIZE values"""
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        chunk = values[start : start + IN_CHUNK_SIZE]
+        placeholders = ", ".join(f":value_{x}" for x in range(len(chunk)))
+        bindings = [QueryBinding(f":value_{x}", value) for x, value in enumerate(chunk)]
+        yield placeholders, bindings
+
+
+def copy_chunks(
+    copies: List[Tuple[Any, Any]]
+) -> Iterator[Tuple[str, List[QueryBinding]]]:
+    """Yields (VALUES rows, bindings) for chunks of (new ID, source ID) pairs"""
+    size = IN_CHUNK_SIZE // 2
+    for start in range(0, len(copies), size):
+        chunk = copies[start : start + size]
+        rows = ", ".join(f"(:new_{x}, :source_{x}, {x})" for x in range(len(chunk)))
+        bindings = []
+        for x, (new_id, source_id) in enumerate(chunk):
+            bindings.append(QueryBinding(f":new_{x}", new_id))
+            bindings.append(QueryBinding(f":source_{x}", source_id))
+        yield rows, bindings
+
+
+def copy_rows(
+    context: DatabaseContext,
+    table: str,
+    fields: List[str],
+    copies: List[Tuple[Any, Any]],
+) -> bool:
+    """Inserts copies of rows under new IDs, given as (new ID, source ID) pairs"""
+    columns = ", ".join(fields)
+    values = ", ".join(f"{table}.{field}" for field in fields)
+    for rows, bindings in copy_chunks(copies):
+        query = f"""
+            WITH copies(new_id, source_id, position) AS (VALUES {rows})
+            INSERT INTO {table} (id, {columns})
+            SELECT copies.new_id, {values}
+            FROM copies
+            INNER JOIN {table}
+            ON {table}.id = copies.source_id
+            ORDER BY copies.position;
+        """
+        if not context.execute_sql_command(query, bindings):
+            return False
+    return True
+
+
+def get_ids_where_in(
+    context: DatabaseContext,
+    table: str,
+    field: str,
+    values: List[Any],
+    column: str = "id",
+) -> List[Any]:
+    """Returns the column, by default the ID, of rows whose field is in values"""
+    ids = []
+    for placeholders, bindings in in_list_chunks(values):
+        query = f"SELECT {column} FROM {table} WHERE {field} IN ({placeholders});"
+        result: QSqlQuery = context.execute_sql_command(query, bindings)
+        if not result:
+            logging.error("Failed to find rows in %s by %s", table, field)
+            continue
+        while result.next():
+            ids.append(result.value(0))
+    return ids
+
+
+def delete_where_in(
+    context: DatabaseContext, table: str, field: str, values: List[Any]
+) -> bool:
+    """Deletes the rows whose field holds any of the values"""
+    for placeholders, bindings in in_list_chunks(values):
+        query = f"DELETE FROM {table} WHERE {field} IN ({placeholders});"
+        if not context.execute_sql_command(query, bindings):
+            return False
+    return True
+
+
+def update_where_in(
+    context: DatabaseContext,
+    table: str,
+    field: str,
+    value: Any,
+    key: str,
+    values: List[Any],
+) -> bool:
+    """Sets the field to value on the rows whose key holds any of the values"""
+    for placeholders, bindings in in_list_chunks(values):
+        query = (
+            f"UPDATE {table} SET {field} = :new_value WHERE {key} IN ({placeholders});"
+        )
+        bindings.append(QueryBinding(":new_value", value))
+        if not context.execute_sql_command(query, bindings):
+            return False
+    return True
+
+
 def remove_all_tags_for_base(context: DatabaseContext, base_id: int):
     """Remove all the tags for a given base"""
-    query = "DELETE from bases_tags WHERE bases_id = :base_id;"
+    query = """
+        DELETE FROM bases_tags
+        WHERE bases_key = (SELECT key FROM bases WHERE id = :base_id);
+    """
     bindings = [QueryBinding(":base_id", base_id)]
     result = context.execute_sql_command(query, bindings)
     if not result:
@@ -135,21 +501,110 @@ def remove_all_tags_for_base(context: DatabaseContext, base_id: int):
 
 def add_tag_to_base(context: DatabaseContext, base_id: int, tag_id: int):
     """ "Add a tag usage for a given tag/base combination"""
-    query = "INSERT INTO bases_tags VALUES(NULL, :base_id, :tag_id)"
+    # The keys are filled in by triggers, once the base and tag exist
+    query = """
+        INSERT INTO bases_tags (id, bases_id, tags_id)
+        VALUES (NULL, :base_id, :tag_id);
+    """
     bindings = [QueryBinding(":base_id", base_id), QueryBinding(":tag_id", tag_id)]
     result = context.execute_sql_command(query, bindings)
     if not result:
         logging.error("Failed to associate tag %s to base %s", tag_id, base_id)
 
 
+def copy_tags_to_bases(context: DatabaseContext, copies: List[Tuple[Any, Any]]) -> bool:
+    """Gives each new base the tags of its source, as (new ID, source ID) pairs"""
+    for rows, bindings in copy_chunks(copies):
+        query = f"""
+            WITH copies(new_id, source_id, position) AS (VALUES {rows})
+            INSERT INTO bases_tags (id, bases_id, tags_id, bases_key, tags_key)
+            SELECT NULL, copy.id, bases_tags.tags_id, copy.key, bases_tags.tags_key
+            FROM copies
+            INNER JOIN bases AS source ON source.id = copies.source_id
+            INNER JOIN bases AS copy ON copy.id = copies.new_id
+            INNER JOIN bases_tags ON bases_tags.bases_key = source.key
+            ORDER BY copies.position, bases_tags.rowid;
+        """
+        if not context.execute_sql_command(query, bindings):
+            logging.error("Failed to copy tags to the duplicated bases")
+            return False
+    return True
+
+
+def set_tags_for_bases(
+    context: DatabaseContext, base_ids: List[Any], tag_ids: List[Any]
+) -> bool:
+    """
+    Gives every base exactly the given tags, only deleting the tag uses that
+    are not wanted and inserting the ones that are missing. Bases not yet
+    submitted get their keys once they are inserted.
+    """
+    tags = ", ".join(f":tag_{x}" for x in range(len(tag_ids)))
+    positions = ", ".join(f"(:tag_{x}, {x})" for x in range(len(tag_ids)))
+    tag_bindings = [QueryBinding(f":tag_{x}", tag) for x, tag in enumerate(tag_ids)]
+    for placeholders, bindings in in_list_chunks(base_ids):
+        # SQLite accepts an empty list, so no tags removes all of them
+        query = f"""
+            DELETE FROM bases_tags
+            WHERE bases_key IN (SELECT key FROM bases WHERE id IN ({placeholders}))
+            AND tags_key NOT IN (SELECT key FROM tags WHERE id IN ({tags}));
+        """
+        if not context.execute_sql_command(query, bindings + tag_bindings):
+            logging.error("Failed to remove tags from the bases")
+            return False
+        query = f"""
+            DELETE FROM bases_tags
+            WHERE bases_key IS NULL AND bases_id IN ({placeholders})
+            AND tags_id NOT IN ({tags});
+        """
+        if not context.execute_sql_command(query, bindings + tag_bindings):
+            logging.error("Failed to remove tags from the unsubmitted bases")
+            return False
+        if not tag_ids:
+            continue
+        targets = ", ".join(
+            f"({binding.placeholder}, {x})" for x, binding in enumerate(bindings)
+        )
+        query = f"""
+            WITH
+                targets(bases_id, position) AS (VALUES {targets}),
+                wanted(tags_id, position) AS (VALUES {positions})
+            INSERT INTO bases_tags (id, bases_id, tags_id, bases_key, tags_key)
+            SELECT NULL, targets.bases_id, tags.id, bases.key, tags.key
+            FROM targets
+            CROSS JOIN wanted
+            INNER JOIN tags ON tags.id = wanted.tags_id
+            LEFT JOIN bases ON bases.id = targets.bases_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM bases_tags
+                WHERE bases_tags.bases_key = bases.key
+                AND bases_tags.tags_key = tags.key
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM bases_tags
+                WHERE bases_tags.bases_key IS NULL
+                AND bases_tags.bases_id = targets.bases_id
+                AND bases_tags.tags_id = tags.id
+            )
+            ORDER BY targets.position, wanted.position;
+        """
+        if not context.execute_sql_command(query, bindings + tag_bindings):
+            logging.error("Failed to add tags to the bases")
+            return False
+    return True
+
+
 def get_tags_for_base(context: DatabaseContext, base_id: int) -> List[Tag]:
     """Returns all tags for a given base ID"""
     query = """
-        SELECT tags.id AS tag_id, tags.name AS tag_name 
-        FROM tags 
-        INNER JOIN bases_tags 
-        ON bases_tags.tags_id = tags.id 
-        WHERE bases_tags.bases_id = :base_id;
+        SELECT tags.id AS tag_id, tags.name AS tag_name
+        FROM bases
+        INNER JOIN bases_tags
+        ON bases_tags.bases_key = bases.key
+        INNER JOIN tags
+        ON tags.key = bases_tags.tags_key
+        WHERE bases.id = :base_id
+        ORDER BY bases_tags.rowid;
         """
     bindings = [QueryBinding(":base_id", base_id)]
     result: QSqlQuery = context.execute_sql_command(query, bindings)
@@ -167,14 +622,37 @@ def get_tags_for_base(context: DatabaseContext, base_id: int) -> List[Tag]:
     return tags
 
 
+def get_all_tags_for_bases(context: DatabaseContext) -> Dict[str, Tuple[Tag, ...]]:
+    """Returns the tags for every base, keyed by base ID"""
+    query = """
+        SELECT bases_tags.bases_id AS base_id, tags.id AS tag_id, tags.name AS tag_name
+        FROM bases_tags
+        INNER JOIN tags
+        ON tags.key = bases_tags.tags_key
+        ORDER BY bases_tags.rowid;
+        """
+    result: QSqlQuery = context.execute_sql_command(query)
+    if not result:
+        logging.error("Failed to retrieve the tags from the database for all bases")
+        return {}
+
+    tags: Dict[str, List[Tag]] = {}
+    while result.next():
+        tag = Tag(result.value("tag_id"), result.value("tag_name"))
+        tags.setdefault(result.value("base_id"), []).append(tag)
+    return {base_id: tuple(base_tags) for base_id, base_tags in tags.items()}
+
+
 def get_bases_for_tag(context: DatabaseContext, tag_id: int) -> List[int]:
     """Return a list of bases that have the given tag applied"""
     query = """
         SELECT bases.id as base_id
-        FROM bases
+        FROM tags
         INNER JOIN bases_tags
-        ON bases_tags.bases_id = bases.id
-        WHERE bases_tags.tags_id = :tag_id;
+        ON bases_tags.tags_key = tags.key
+        INNER JOIN bases
+        ON bases.key = bases_tags.bases_key
+        WHERE tags.id = :tag_id;
     """
     bindings = [QueryBinding(":tag_id", tag_id)]
     result: QSqlQuery = context.execute_sql_command(query, bindings)
@@ -190,8 +668,10 @@ def get_tag_count(context: DatabaseContext, tag_id: int) -> int:
     """Returns a count of how many times the given tag is used"""
     query = """
         SELECT count(*) cnt
-        FROM bases_tags
-        WHERE tags_id = :tag_id;
+        FROM tags
+        INNER JOIN bases_tags
+        ON bases_tags.tags_key = tags.key
+        WHERE tags.id = :tag_id;
     """
     bindings = [QueryBinding(":tag_id", tag_id)]
     result: QSqlQuery = context.execute_sql_command(query, bindings)
@@ -210,3 +690,28 @@ def remove_scheme_components(context: DatabaseContext, scheme_id: int) -> bool:
     bindings = [QueryBinding(":schemes_id", scheme_id)]
     result: QSqlQuery = context.execute_sql_command(query, bindings)
     return bool(result)
+
+
+def count_per_month(
+    context: DatabaseContext,
+    table: str,
+    field: str,
+    start: str = EARLIEST_DATE,
+    end: str = LATEST_DATE,
+) -> Dict[Tuple[str, str], int]:
+    """Counts the rows per (year, month) of the date field between start and end"""
+    query = f"""
+        SELECT substr({field}, 1, 4) AS year, substr({field}, 6, 2) AS month,
+        count(*) AS cnt
+        FROM {table}
+        WHERE {range_clause(field, start, end)}
+        GROUP BY year, month;
+    """
+    result: QSqlQuery = context.execute_sql_command(query)
+    if not result:
+        logging.error("Failed to count %s per month", field)
+        return {}
+    counts = {}
+    while result.next():
+        counts[(result.value("year"), result.value("month"))] = result.value("cnt")
+    return counts
@@ -1,6 +1,6 @@
 """ Definitions for the database tables """
 
-LATEST_DATABASE_VERSION = 1
+LATEST_DATABASE_VERSION = 4
 
 VERSION_1 = """
 CREATE TABLE settings (
@@ -113,3 +113,236 @@ CREATE TABLE scheme_components (
     recipes_id TEXT DEFAULT ""
 );
 """
+
+VERSION_2 = """
+DELETE FROM bases_tags WHERE rowid NOT IN (
+    SELECT MIN(rowid) FROM bases_tags GROUP BY bases_id, tags_id
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bases_tags_bases_id_tags_id ON bases_tags(bases_id, tags_id);
+CREATE INDEX IF NOT EXISTS idx_bases_tags_tags_id ON bases_tags(tags_id);
+
+CREATE INDEX IF NOT EXISTS idx_bases_storages_id ON bases(storages_id);
+CREATE INDEX IF NOT EXISTS idx_bases_status_id ON bases(status_id);
+CREATE INDEX IF NOT EXISTS idx_bases_schemes_id ON bases(schemes_id);
+
+CREATE INDEX IF NOT EXISTS idx_recipe_steps_recipes_id ON recipe_steps(recipes_id);
+CREATE INDEX IF NOT EXISTS idx_recipe_steps_paints_id ON recipe_steps(paints_id);
+CREATE INDEX IF NOT EXISTS idx_recipe_steps_operations_id ON recipe_steps(operations_id);
+
+CREATE INDEX IF NOT EXISTS idx_scheme_components_schemes_id ON scheme_components(schemes_id);
+CREATE INDEX IF NOT EXISTS idx_scheme_components_recipes_id ON scheme_components(recipes_id);
+"""
+
+# Integer keys for bases and tags, so tag uses join on integers. The UUID in
+# the id column stays the stable identifier used for import and export.
+VERSION_3 = """
+CREATE TABLE bases_new (
+    id TEXT UNIQUE,
+    name TEXT DEFAULT "",
+    scale TEXT DEFAULT "",
+    base TEXT DEFAULT "Round",
+    width INTEGER DEFAULT 20,
+    depth INTEGER DEFAULT 0,
+    figures INTEGER DEFAULT 1,
+    material TEXT DEFAULT "Plastic",
+    sculptor TEXT DEFAULT "",
+    manufacturer TEXT DEFAULT "",
+    pack_code TEXT DEFAULT "",
+    retailer TEXT DEFAULT "",
+    price FLOAT DEFAULT 0.0,
+    date_added DATE DEFAULT CURRENT_DATE,
+    date_acquired DATE DEFAULT 0,
+    date_completed DATE DEFAULT 0,
+    damaged BOOLEAN DEFAULT 0,
+    notes TEXT DEFAULT "",
+    custom_id TEXT DEFAULT "",
+    storages_id TEXT DEFAULT "",
+    status_id TEXT DEFAULT "",
+    schemes_id TEXT DEFAULT "",
+    key INTEGER PRIMARY KEY,
+
+    CONSTRAINT fk_storages_id FOREIGN KEY(storages_id) REFERENCES storages(id),
+    CONSTRAINT fk_status_id FOREIGN KEY(status_id) REFERENCES statuses(id),
+    CONSTRAINT fk_scheme_id FOREIGN KEY(schemes_id) REFERENCES colour_schemes(id)
+);
+INSERT INTO bases_new SELECT
+    id, name, scale, base, width, depth, figures, material, sculptor,
+    manufacturer, pack_code, retailer, price, date_added, date_acquired,
+    date_completed, damaged, notes, custom_id, storages_id, status_id,
+    schemes_id, rowid
+FROM bases ORDER BY rowid;
+DROP TABLE bases;
+ALTER TABLE bases_new RENAME TO bases;
+
+CREATE TABLE tags_new (
+    id TEXT UNIQUE,
+    name TEXT,
+    key INTEGER PRIMARY KEY
+);
+INSERT INTO tags_new SELECT id, name, rowid FROM tags ORDER BY rowid;
+DROP TABLE tags;
+ALTER TABLE tags_new RENAME TO tags;
+
+CREATE TABLE bases_tags_new (
+    id TEXT PRIMARY KEY,
+    bases_id TEXT,
+    tags_id TEXT,
+    bases_key INTEGER,
+    tags_key INTEGER,
+
+    CONSTRAINT fk_bases_key FOREIGN KEY(bases_key) REFERENCES bases(key) ON DELETE CASCADE,
+    CONSTRAINT fk_tags_key FOREIGN KEY(tags_key) REFERENCES tags(key) ON DELETE CASCADE
+);
+INSERT INTO bases_tags_new SELECT
+    bases_tags.id, bases_tags.bases_id, bases_tags.tags_id, bases.key, tags.key
+FROM bases_tags
+LEFT JOIN bases ON bases.id = bases_tags.bases_id
+LEFT JOIN tags ON tags.id = bases_tags.tags_id
+ORDER BY bases_tags.rowid;
+DROP TABLE bases_tags;
+ALTER TABLE bases_tags_new RENAME TO bases_tags;
+
+CREATE INDEX IF NOT EXISTS idx_bases_storages_id ON bases(storages_id);
+CREATE INDEX IF NOT EXISTS idx_bases_status_id ON bases(status_id);
+CREATE INDEX IF NOT EXISTS idx_bases_schemes_id ON bases(schemes_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bases_tags_bases_key_tags_key ON bases_tags(bases_key, tags_key);
+CREATE INDEX IF NOT EXISTS idx_bases_tags_tags_key ON bases_tags(tags_key);
+CREATE INDEX IF NOT EXISTS idx_bases_tags_unresolved_bases ON bases_tags(bases_id) WHERE bases_key IS NULL;
+CREATE INDEX IF NOT EXISTS idx_bases_tags_unresolved_tags ON bases_tags(tags_id) WHERE tags_key IS NULL
+"""
+
+BASES_TAGS_RESOLVE_KEYS = """
+    CREATE TRIGGER bases_tags_resolve_keys AFTER INSERT ON bases_tags
+    WHEN NEW.bases_key IS NULL OR NEW.tags_key IS NULL
+    BEGIN
+        UPDATE bases_tags SET
+            bases_key = (SELECT key FROM bases WHERE id = NEW.bases_id),
+            tags_key = (SELECT key FROM tags WHERE id = NEW.tags_id)
+        WHERE rowid = NEW.rowid;
+    END
+"""
+
+BASES_TAGS_UPDATE_KEYS = """
+    CREATE TRIGGER bases_tags_update_keys AFTER UPDATE OF bases_id, tags_id ON bases_tags
+    BEGIN
+        UPDATE bases_tags SET
+            bases_key = (SELECT key FROM bases WHERE id = NEW.bases_id),
+            tags_key = (SELECT key FROM tags WHERE id = NEW.tags_id)
+        WHERE rowid = NEW.rowid;
+    END
+"""
+
+BASES_RESOLVE_TAG_USES = """
+    CREATE TRIGGER bases_resolve_tag_uses AFTER INSERT ON bases
+    BEGIN
+        UPDATE bases_tags SET bases_key = NEW.key
+        WHERE bases_key IS NULL AND bases_id = NEW.id;
+    END
+"""
+
+# Triggers keep the keys of tag uses in step with their IDs. They contain
+# semicolons, so are executed one by one.
+VERSION_3_TRIGGERS = [
+    BASES_TAGS_RESOLVE_KEYS,
+    BASES_TAGS_UPDATE_KEYS,
+    # Tag uses may be imported before the bases and tags they refer to
+    BASES_RESOLVE_TAG_USES,
+    """
+    CREATE TRIGGER tags_resolve_tag_uses AFTER INSERT ON tags
+    BEGIN
+        UPDATE bases_tags SET tags_key = NEW.key
+        WHERE tags_key IS NULL AND tags_id = NEW.id;
+    END
+    """,
+]
+
+# Dates as ISO-8601 text, NULL if unknown, so date ranges are indexed lookups.
+# Values that aren't dates are kept as they are. Triggers referring to bases
+# would stop it being renamed, so are dropped and created again.
+VERSION_4 = """
+DROP TRIGGER IF EXISTS bases_tags_resolve_keys;
+DROP TRIGGER IF EXISTS bases_tags_update_keys;
+CREATE TABLE bases_new (
+    id TEXT UNIQUE,
+    name TEXT DEFAULT "",
+    scale TEXT DEFAULT "",
+    base TEXT DEFAULT "Round",
+    width INTEGER DEFAULT 20,
+    depth INTEGER DEFAULT 0,
+    figures INTEGER DEFAULT 1,
+    material TEXT DEFAULT "Plastic",
+    sculptor TEXT DEFAULT "",
+    manufacturer TEXT DEFAULT "",
+    pack_code TEXT DEFAULT "",
+    retailer TEXT DEFAULT "",
+    price FLOAT DEFAULT 0.0,
+    date_added DATE DEFAULT CURRENT_DATE,
+    date_acquired DATE DEFAULT NULL,
+    date_completed DATE DEFAULT NULL,
+    damaged BOOLEAN DEFAULT 0,
+    notes TEXT DEFAULT "",
+    custom_id TEXT DEFAULT "",
+    storages_id TEXT DEFAULT "",
+    status_id TEXT DEFAULT "",
+    schemes_id TEXT DEFAULT "",
+    key INTEGER PRIMARY KEY,
+
+    CONSTRAINT fk_storages_id FOREIGN KEY(storages_id) REFERENCES storages(id),
+    CONSTRAINT fk_status_id FOREIGN KEY(status_id) REFERENCES statuses(id),
+    CONSTRAINT fk_scheme_id FOREIGN KEY(schemes_id) REFERENCES colour_schemes(id)
+);
+INSERT INTO bases_new SELECT
+    id, name, scale, base, width, depth, figures, material, sculptor,
+    manufacturer, pack_code, retailer, price,
+    CASE WHEN date_added IN (0, '') THEN NULL
+        ELSE coalesce(date(date_added), date_added) END,
+    CASE WHEN date_acquired IN (0, '') THEN NULL
+        ELSE coalesce(date(date_acquired), date_acquired) END,
+    CASE WHEN date_completed IN (0, '') THEN NULL
+        ELSE coalesce(date(date_completed), date_completed) END,
+    damaged, notes, custom_id, storages_id, status_id, schemes_id, key
+FROM bases ORDER BY key;
+DROP TABLE bases;
+ALTER TABLE bases_new RENAME TO bases;
+
+CREATE INDEX IF NOT EXISTS idx_bases_storages_id ON bases(storages_id);
+CREATE INDEX IF NOT EXISTS idx_bases_status_id ON bases(status_id);
+CREATE INDEX IF NOT EXISTS idx_bases_schemes_id ON bases(schemes_id);
+CREATE INDEX IF NOT EXISTS idx_bases_date_added ON bases(date_added);
+CREATE INDEX IF NOT EXISTS idx_bases_date_acquired ON bases(date_acquired);
+CREATE INDEX IF NOT EXISTS idx_bases_date_completed ON bases(date_completed)
+"""
+
+VERSION_4_TRIGGERS = [
+    BASES_TAGS_RESOLVE_KEYS,
+    BASES_TAGS_UPDATE_KEYS,
+    BASES_RESOLVE_TAG_USES,
+    # Unknown dates are stored as NULL, whatever the source wrote
+    """
+    CREATE TRIGGER bases_unknown_dates AFTER INSERT ON bases
+    WHEN NEW.date_added IN (0, '')
+    OR NEW.date_acquired IN (0, '')
+    OR NEW.date_completed IN (0, '')
+    BEGIN
+        UPDATE bases SET
+            date_added = nullif(nullif(date_added, 0), ''),
+            date_acquired = nullif(nullif(date_acquired, 0), ''),
+            date_completed = nullif(nullif(date_completed, 0), '')
+        WHERE key = NEW.key;
+    END
+    """,
+    """
+    CREATE TRIGGER bases_unknown_dates_update
+    AFTER UPDATE OF date_added, date_acquired, date_completed ON bases
+    WHEN NEW.date_added IN (0, '')
+    OR NEW.date_acquired IN (0, '')
+    OR NEW.date_completed IN (0, '')
+    BEGIN
+        UPDATE bases SET
+            date_added = nullif(nullif(date_added, 0), ''),
+            date_acquired = nullif(nullif(date_acquired, 0), ''),
+            date_completed = nullif(nullif(date_completed, 0), '')
+        WHERE key = NEW.key;
+    END
+    """,
+]
@@ -1,6 +1,7 @@
 """ Data classes for context """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any, List
 
 
 @dataclass
@@ -34,3 +35,20 @@ class SchemeComponent:
 
     name: str
     recipe_id: int
+
+
+@dataclass
+class RowChanges:
+    """IDs of the rows inserted, updated and deleted in a table"""
+
+    inserted: List[Any] = field(default_factory=list)
+    updated: List[Any] = field(default_factory=list)
+    deleted: List[Any] = field(default_factory=list)
+
+
+@dataclass(eq=True, frozen=True)
+class ValueRange:
+    """Inclusive range of values, open where a bound is None"""
+
+    minimum: Any = None
+    maximum: Any = None
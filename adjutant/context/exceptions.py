@@ -19,3 +19,7 @@ class DatabaseIsNewer(RuntimeError):
 
 class SettingsFileCorrupt(RuntimeError):
     """Raised when the settings file is corrupted somehow"""
+
+
+class TransactionFailed(RuntimeError):
+    """Raised to abort and roll back the current database transaction"""
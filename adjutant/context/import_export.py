@@ -4,6 +4,7 @@ import logging
 from typing import Dict, List
 import yaml
 
+from adjutant.context.database_context import INTERNAL_FIELDS
 from adjutant.models.relational_model import RelationalModel
 
 
@@ -19,7 +20,7 @@ def write_models_to_yaml(models: Dict[str, RelationalModel], filename: str):
             data_record = {}
             for column in range(model.columnCount()):
                 field_name = record.fieldName(column)
-                if field_name == "":
+                if field_name == "" or field_name in INTERNAL_FIELDS:
                     continue
                 data_record[record.fieldName(column)] = record.value(column)
             data_records.append(data_record)
@@ -5,7 +5,11 @@ from dataclasses import dataclass
 
 from PyQt6.QtCore import QSortFilterProxyModel, Qt
 from adjutant.models.bases_model import BasesModel
-from adjutant.context.dataclasses import ManyToManyRelationship, OneToManyRelationship
+from adjutant.context.dataclasses import (
+    ManyToManyRelationship,
+    OneToManyRelationship,
+    RowChanges,
+)
 from adjutant.models.relational_model import RelationalModel
 
 
@@ -91,6 +95,34 @@ class ModelContext:
         self.tags_sort_model.sort(
             self.tags_model.fieldIndex("name"), Qt.SortOrder.AscendingOrder
         )
+        # Renamed or deleted tags are patched into the tag index
+        self.bases_model.set_many_to_many_model(self.tags_model)
+        self._setup_lookups()
+
+    def _setup_lookups(self) -> None:
+        """Resolve one-to-many relationships from the loaded target models"""
+        for model in self.models.values():
+            for field, relationship in model.o2m_relationships.items():
+                target = self.get(relationship.target_table)
+                if target is not None:
+                    model.set_one_to_many_model(field, target)
+
+    def version(self, table: str) -> int:
+        """Returns the current data version of the table's model"""
+        return self.get(table).data_version
+
+    def changed_since(self, table: str, version: int) -> bool:
+        """Returns whether the table changed after the given version"""
+        return self.get(table).changed_since(version)
+
+    def apply_changes(self, table: str, changes: RowChanges) -> None:
+        """Apply rows changed in the database to the models showing them"""
+        model = self.get(table)
+        if model is not None:
+            model.apply_changes(changes)
+        if table == "bases_tags" and (changes.inserted or changes.deleted):
+            # Tag uses are shown on the bases model
+            self.bases_model.update_tag_cache()
 
     def refresh_models(self) -> None:
         """Reselects rows on all models"""
@@ -146,6 +178,7 @@ class ModelContext:
                 HeaderData("Storage", "Where this base is kept"),
                 HeaderData("Status", "What status this base is in"),
                 HeaderData("Colour Scheme", "The colour scheme for this mini"),
+                HeaderData("Key", "Internal key of this base"),
                 HeaderData("Tags", "All tags associated with this base"),
             ],
         )
@@ -2,6 +2,7 @@
 
 from adjutant.context.model_context import ModelContext
 from adjutant.context.database_context import generate_uuid
+from adjutant.context.dataclasses import RowChanges
 from adjutant.models.relational_model import RelationalModel
 
 
@@ -350,4 +351,6 @@ class SampleData:
         self._load_records(bases, self.models.bases_model)
         self._load_records(bases_tags, self.models.base_tags_model)
 
-        self.models.refresh_models()
+        self.models.apply_changes(
+            "bases_tags", RowChanges(inserted=[x["id"] for x in bases_tags])
+        )
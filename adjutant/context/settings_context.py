@@ -18,6 +18,7 @@ class SettingsContext:
 
     version_string: str = ""
     font_size: int = 9
+    database_profile: str = "fast"
 
     def load(self) -> None:
         """Load from settings file"""
@@ -37,12 +38,14 @@ class SettingsContext:
             raise NoSettingsFileFound from exc
 
         self.font_size = settings.get("font_size", self.font_size)
+        self.database_profile = settings.get("database_profile", self.database_profile)
         self.version_string = f"{V_MAJOR}.{V_MINOR}.{V_PATCH}-{V_STAGE}"
 
     def save(self) -> None:
         """Save the settings to file"""
         settings: Dict[str, Any] = {}
         settings["font_size"] = self.font_size
+        settings["database_profile"] = self.database_profile
 
         with SETTINGS_FILE.open("w") as outfile:
             yaml.dump(settings, outfile)
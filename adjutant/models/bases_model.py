@@ -3,12 +3,17 @@
 from PyQt6.QtCore import QModelIndex, Qt
 from adjutant.models.relational_model import RelationalModel
 
+# Larger collections are fetched page by page as the table scrolls
+PAGED_ROW_THRESHOLD = 100000
+
 
 class BasesModel(RelationalModel):
     """Subclass QSqlTableModel"""
 
     def __init__(self, parent=None) -> None:
         super().__init__(parent=parent)
+        self.snapshot_enabled = True
+        self.paged_threshold = PAGED_ROW_THRESHOLD
 
     # def select(self) -> bool:
     #     """Reload all data from the database"""
@@ -0,0 +1,333 @@
+""" Column-oriented snapshot of a model for bulk filtering """
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Tuple, Union
+from PyQt6.QtCore import QAbstractItemModel, Qt
+from adjutant.context.dataclasses import Tag, ValueRange
+from adjutant.models.tag_index import TagIndex
+
+
+def rows_to_mask(rows: Iterable[int], row_count: int) -> int:
+    """Converts row numbers into a mask with one byte per row set to 1"""
+    mask = bytearray(row_count)
+    for row in rows:
+        mask[row] = 1
+    return int.from_bytes(mask, "little")
+
+
+def tag_names(tags: Tuple[Tag, ...]) -> str:
+    """Display text for a set of tags"""
+    return ",".join(tag.tag_name for tag in tags)
+
+
+def display_text(value: Any) -> str:
+    """Text shown for a raw value, matching how Qt converts it for display"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        text = repr(value)
+        return text[:-2] if text.endswith(".0") else text
+    return str(value)
+
+
+def comparable(value: Any, value_range: ValueRange) -> bool:
+    """Whether the value is of the same kind as the range's bounds"""
+    bound = value_range.maximum if value_range.minimum is None else value_range.minimum
+    if isinstance(bound, str):
+        return isinstance(value, str) and value != ""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def in_range(value: Any, value_range: ValueRange) -> bool:
+    """Whether the value lies within the range"""
+    if not comparable(value, value_range):
+        return False
+    if value_range.minimum is not None and value < value_range.minimum:
+        return False
+    return value_range.maximum is None or value <= value_range.maximum
+
+
+class ColumnSnapshot:
+    """
+    Column-oriented copy of a model's rows. Every column is dictionary
+    encoded, storing each distinct value once with the rows that hold it, so
+    filters are evaluated per distinct value and combined as whole-table masks.
+    """
+
+    def __init__(self, row_count: int) -> None:
+        self.row_count = row_count
+        self.all_rows = int.from_bytes(b"\x01" * row_count, "little")
+        self.columns: List[Dict[Any, List[int]]] = []
+        self.values: List[List[Any]] = []
+        self.display: List[Dict[Any, str]] = []
+        self.folded: List[Dict[Any, str]] = []
+        self.tag_column = -1
+        self.tag_index: TagIndex = None
+        self.untagged: List[int] = []
+        self.masks: Dict[Tuple[int, Any], int] = {}
+        self.sorted_values: Dict[Tuple[int, bool], List[Any]] = {}
+
+    @classmethod
+    def from_model(
+        cls,
+        model: QAbstractItemModel,
+        field_count: int,
+        tag_index: TagIndex = None,
+    ) -> "ColumnSnapshot":
+        """
+        Build a snapshot of all rows. Columns up to field_count are read from
+        the records, display text is resolved once per distinct value. The
+        column after that holds the tags, if given.
+        """
+        rows = []
+        for row in range(model.rowCount()):
+            record = model.record(row)
+            rows.append(tuple(record.value(column) for column in range(field_count)))
+        return cls.from_rows(model, field_count, rows, tag_index)
+
+    @classmethod
+    def from_rows(
+        cls,
+        model: QAbstractItemModel,
+        field_count: int,
+        rows: List[Tuple[Any, ...]],
+        tag_index: TagIndex = None,
+        raw_columns: Iterable[int] = (),
+    ) -> "ColumnSnapshot":
+        """
+        Build a snapshot from the field values of the model's rows, in the
+        same order. Columns in raw_columns display their values unchanged,
+        the display text of the others is read from the model.
+        """
+        snapshot = cls(len(rows))
+        snapshot.columns = [{} for _ in range(field_count)]
+        snapshot.values = [list(values) for values in zip(*rows)] or [
+            [] for _ in range(field_count)
+        ]
+        for column, values in enumerate(snapshot.values):
+            encoded = snapshot.columns[column]
+            for row, value in enumerate(values):
+                encoded.setdefault(value, []).append(row)
+
+        snapshot.display = [{} for _ in range(field_count)]
+        snapshot.folded = [{} for _ in range(field_count)]
+        raw_columns = set(raw_columns)
+        for column in range(field_count):
+            snapshot.refresh_display(model, column, column in raw_columns)
+        if tag_index is not None:
+            snapshot.set_tags(tag_index)
+        return snapshot
+
+    def refresh_display(
+        self, model: QAbstractItemModel, column: int, raw: bool = False
+    ) -> None:
+        """Resolve the display text of every distinct value in the column"""
+        display = self.display[column]
+        for value, rows in self.columns[column].items():
+            if raw:
+                display[value] = display_text(value)
+                continue
+            text = model.index(rows[0], column).data(Qt.ItemDataRole.DisplayRole)
+            display[value] = display_text(text)
+        self.folded[column] = {
+            value: text.casefold() for value, text in display.items()
+        }
+
+    def update_row(self, model: QAbstractItemModel, row: int) -> None:
+        """Re-encode a single row after its values changed"""
+        if row >= self.row_count:
+            return
+        record = model.record(row)
+        for column, values in enumerate(self.values):
+            old = values[row]
+            new = record.value(column)
+            if old == new:
+                continue
+            self.columns[column][old].remove(row)
+            if not self.columns[column][old]:
+                del self.columns[column][old]
+                del self.display[column][old]
+                del self.folded[column][old]
+            if new not in self.columns[column]:
+                text = model.index(row, column).data(Qt.ItemDataRole.DisplayRole)
+                self.display[column][new] = display_text(text)
+                self.folded[column][new] = self.display[column][new].casefold()
+            self.columns[column].setdefault(new, []).append(row)
+            values[row] = new
+            self.masks.pop((column, old), None)
+            self.masks.pop((column, new), None)
+            self._reset_range_masks(column)
+
+    def set_tags(self, tag_index: TagIndex) -> None:
+        """Encode the tags of every row as the tag column"""
+        if self.tag_column == -1:
+            self.tag_column = len(self.columns)
+            self.columns.append({})
+            self.display.append({})
+            self.folded.append({})
+        self.tag_index = tag_index
+        self.untagged = []
+        self.columns[self.tag_column] = {}
+        self.display[self.tag_column] = {}
+        self.folded[self.tag_column] = {}
+        for row, base_id in self._row_values(0):
+            self._add_row_tags(row, tag_index.tags_for(base_id))
+        self._reset_tag_masks()
+
+    def update_tags(self, row: int, old: Tuple[Tag, ...], new: Tuple[Tag, ...]):
+        """Replace the tags of a single row, once the tag index holds them"""
+        if self.tag_column == -1 or row >= self.row_count:
+            return
+        if not old:
+            self.untagged.remove(row)
+        names = tag_names(old)
+        self.columns[self.tag_column][names].remove(row)
+        if not self.columns[self.tag_column][names]:
+            del self.columns[self.tag_column][names]
+            del self.display[self.tag_column][names]
+            del self.folded[self.tag_column][names]
+        self._add_row_tags(row, new)
+        self._reset_tag_masks()
+
+    def _add_row_tags(self, row: int, tags: Tuple[Tag, ...]) -> None:
+        """Add the row's tag names to the tag column"""
+        if not tags:
+            self.untagged.append(row)
+        names = tag_names(tags)
+        self.columns[self.tag_column].setdefault(names, []).append(row)
+        self.display[self.tag_column][names] = names
+        self.folded[self.tag_column][names] = names.casefold()
+
+    def _reset_tag_masks(self) -> None:
+        """Drop cached masks that depend on the tags"""
+        self.masks = {
+            key: mask for key, mask in self.masks.items() if key[0] != self.tag_column
+        }
+
+    def _reset_range_masks(self, column: int) -> None:
+        """Drop the sorted values and range masks of the column"""
+        self.masks = {
+            key: mask
+            for key, mask in self.masks.items()
+            if key[0] != column or not isinstance(key[1], ValueRange)
+        }
+        self.sorted_values = {
+            key: values
+            for key, values in self.sorted_values.items()
+            if key[0] != column
+        }
+
+    def _row_values(self, column: int):
+        """Yields (row, value) for every row in the given column"""
+        for value, rows in self.columns[column].items():
+            for row in rows:
+                yield row, value
+
+    def value_mask(self, column: int, value: Any) -> int:
+        """Mask of the rows holding the value in the column"""
+        key = (column, value)
+        if key not in self.masks:
+            rows = self.columns[column].get(value, [])
+            self.masks[key] = rows_to_mask(rows, self.row_count)
+        return self.masks[key]
+
+    def tag_mask(self, tag_id: Any) -> int:
+        """Mask of the rows that have the given tag"""
+        key = (self.tag_column, tag_id)
+        if key not in self.masks:
+            bases = self.tag_index.bases_for_tag(tag_id)
+            self.masks[key] = rows_to_mask(self._id_rows(bases), self.row_count)
+        return self.masks[key]
+
+    def range_mask(self, column: int, value_range: ValueRange) -> int:
+        """Mask of the rows whose value lies within the range"""
+        key = (column, value_range)
+        if key not in self.masks:
+            values = self._sorted_values(column, value_range)
+            start = 0
+            if value_range.minimum is not None:
+                start = bisect_left(values, value_range.minimum)
+            end = len(values)
+            if value_range.maximum is not None:
+                end = bisect_right(values, value_range.maximum)
+            rows: List[int] = []
+            for value in values[start:end]:
+                rows.extend(self.columns[column][value])
+            self.masks[key] = rows_to_mask(rows, self.row_count)
+        return self.masks[key]
+
+    def _sorted_values(self, column: int, value_range: ValueRange) -> List[Any]:
+        """The column's distinct values comparable to the range, sorted"""
+        key = (column, comparable("text", value_range))
+        if key not in self.sorted_values:
+            self.sorted_values[key] = sorted(
+                value
+                for value in self.columns[column]
+                if comparable(value, value_range)
+            )
+        return self.sorted_values[key]
+
+    def _id_rows(self, ids: Iterable[Any]) -> List[int]:
+        """Rows holding the given IDs"""
+        rows = []
+        for id_ in ids:
+            rows.extend(self.columns[0].get(id_, []))
+        return rows
+
+    def column_mask(self, column: int, values: Union[List[Any], ValueRange]) -> int:
+        """Mask of rows accepted by a column filter"""
+        if column >= len(self.columns):
+            return self.all_rows
+        if isinstance(values, ValueRange):
+            return self.range_mask(column, values)
+        if column == self.tag_column:
+            if not values:
+                return rows_to_mask(self.untagged, self.row_count)
+            if len(values) == 1:
+                return self.tag_mask(values[0])
+            bases = self.tag_index.bases_with_all(values)
+            return rows_to_mask(self._id_rows(bases), self.row_count)
+
+        mask = 0
+        for value in values:
+            mask |= self.value_mask(column, value)
+        return mask
+
+    def text_matches(
+        self,
+        text: str,
+        column: int = -1,
+        case_sensitive=False,
+        within: Dict[int, List[Any]] = None,
+    ) -> Dict[int, List[Any]]:
+        """
+        Distinct values, per column, whose display text contains the text. If
+        within is given, only those values are tested.
+        """
+        if not case_sensitive:
+            text = text.casefold()
+        displays = self.display if case_sensitive else self.folded
+        columns = range(len(self.columns)) if column == -1 else [column]
+        matches: Dict[int, List[Any]] = {}
+        for col in columns:
+            if col >= len(self.columns):
+                continue
+            candidates = displays[col] if within is None else within.get(col, [])
+            matches[col] = [
+                value for value in candidates if text in displays[col][value]
+            ]
+        return matches
+
+    def matches_mask(self, matches: Dict[int, List[Any]]) -> int:
+        """Mask of the rows holding any of the matched values"""
+        rows: List[int] = []
+        for column, values in matches.items():
+            for value in values:
+                rows.extend(self.columns[column][value])
+        return rows_to_mask(rows, self.row_count)
+
+    def accepted_rows(self, mask: int) -> bytes:
+        """Expand a mask into one byte per row, non-zero if accepted"""
+        return mask.to_bytes(self.row_count, "little")
@@ -1,36 +1,67 @@
 """ Bases Model"""
 
+import json
 import logging
-from typing import Dict, List
+from typing import Any, Dict, List, Set, Tuple, Union
 from PyQt6.QtCore import QModelIndex, Qt, pyqtSignal
 from PyQt6.QtGui import QColor
 from PyQt6.QtSql import QSqlQuery, QSqlRecord, QSqlTableModel
 from adjutant.context.dataclasses import (
     OneToManyRelationship,
     ManyToManyRelationship,
+    RowChanges,
     Tag,
+    ValueRange,
 )
+from adjutant.models.column_snapshot import ColumnSnapshot
+from adjutant.models.tag_index import TagIndex
 from adjutant.context.database_context import (
     DatabaseContext,
-    add_tag_to_base,
-    get_tags_for_base,
-    remove_all_tags_for_base,
+    INTERNAL_FIELDS,
+    QueryBinding,
+    get_all_tags_for_bases,
+    range_clause,
+    set_tags_for_bases,
+    sql_literal,
+    update_where_in,
 )
+from adjutant.context.exceptions import TransactionFailed
+
+
+# Fetch policies: all rows on select, or only as they are needed
+FETCH_EAGER = "eager"
+FETCH_ON_DEMAND = "on_demand"
+
+# Beyond this many updated rows, selecting the table again is quicker
+ROW_REFRESH_LIMIT = 100
 
 
 class RelationalModel(QSqlTableModel):
     """Subclass QSqlTableModel"""
 
     data_updated = pyqtSignal()
+    snapshot_updated = pyqtSignal()
+    snapshot_rebuilt = pyqtSignal()
     row_count_updated = pyqtSignal(int)
 
     def __init__(self, parent=None) -> None:
         super().__init__(parent=parent)
         self.m2m_relationships: List[ManyToManyRelationship] = []
         self.o2m_relationships: Dict[int, OneToManyRelationship] = {}
+        self.o2m_lookups: Dict[int, Dict[Any, Any]] = {}
         self.boolean_fields = []
         self.colour_fields = []
         self.id_row_map = {}
+        self.fetch_policy = FETCH_EAGER
+        self.paged = False
+        self.paged_threshold: int = None
+        self.tag_index = TagIndex()
+        self.snapshot_enabled = False
+        self.snapshot: ColumnSnapshot = None
+        self.hidden_rows = 0
+        self.data_version = 0
+        self.linked_models: Dict[int, "RelationalModel"] = {}
+        self.distinct_cache: Dict[int, Tuple[Tuple[int, ...], List[Any]]] = {}
         self.db_context = DatabaseContext()
         self.beforeInsert.connect(lambda: self.row_count_updated.emit(self.rowCount()))
 
@@ -42,28 +73,452 @@ class RelationalModel(QSqlTableModel):
         """Adds a relationship for a given field"""
         self.o2m_relationships[field] = rel
 
-    def update_id_row_map(self) -> None:
-        """Update the internal map from ID -> row number"""
-        self.id_row_map = {}
+    def set_one_to_many_model(self, field: int, target: "RelationalModel") -> None:
+        """Resolve the relationship for the field from the target model's rows"""
+        relationship = self.o2m_relationships[field]
+        self.linked_models[field] = target
+        seen_version = [None]
+
+        def update_lookup():
+            if seen_version[0] == target.data_version:
+                return
+            seen_version[0] = target.data_version
+            self.o2m_lookups[field] = target.lookup_table(
+                relationship.target_key, relationship.target_field
+            )
+            if self.snapshot is not None:
+                self.snapshot.refresh_display(self, field)
+                self.snapshot_updated.emit()
+            if self.rowCount() > 0:
+                self.dataChanged.emit(
+                    self.index(0, field), self.index(self.rowCount() - 1, field)
+                )
+
+        target.data_updated.connect(update_lookup)
+        update_lookup()
+
+    def set_many_to_many_model(self, target: "RelationalModel") -> None:
+        """Keep the cached tag names in step with the target model's rows"""
+        relationship = self.m2m_relationships[0]
+        column = super().columnCount()
+        self.linked_models[column] = target
+        seen_version = [target.data_version]
+
+        def update_names():
+            if seen_version[0] == target.data_version:
+                return
+            seen_version[0] = target.data_version
+            self.tag_index.rename_tags(
+                target.lookup_table("id", relationship.target_field)
+            )
+            self.bump_version()
+            if self.snapshot is not None:
+                self.snapshot.set_tags(self.tag_index)
+                self.snapshot_updated.emit()
+            if self.rowCount() > 0:
+                self.dataChanged.emit(
+                    self.index(0, column), self.index(self.rowCount() - 1, column)
+                )
+
+        target.data_updated.connect(update_names)
+
+    def lookup_table(self, key: str, field: str) -> Dict[Any, Any]:
+        """Returns a map of key -> field for all rows in the model"""
+        self.fetch_all()
+        key_column = self.fieldIndex(key)
+        field_column = self.fieldIndex(field)
+        lookup = {}
         for row in range(self.rowCount()):
             record = self.record(row)
-            self.id_row_map[record.value(0)] = row
+            lookup[record.value(key_column)] = record.value(field_column)
+        return lookup
+
+    def update_id_row_map(self) -> None:
+        """Update the map from ID -> row number for all rows, fetched or not"""
+        ids = self._query_ids()
+        self.id_row_map = {id_: row for row, id_ in enumerate(ids or [])}
+
+    def _query_ids(self) -> List[Any]:
+        """Returns the IDs of the rows the model selects in order, None on failure"""
+        table = self.tableName()
+        query = f"SELECT {table}.{self.record().fieldName(0)} FROM {table}"
+        if self.filter():
+            query += f" WHERE {self.filter()}"
+        result = self.db_context.execute_sql_command(f"{query} {self.orderByClause()}")
+        if not result:
+            logging.error("Failed to load the IDs of %s", table)
+            return None
+        ids = []
+        while result.next():
+            ids.append(result.value(0))
+        return ids
+
+    def apply_changes(self, changes: RowChanges) -> None:
+        """Bring rows changed directly in the database into the model"""
+        inserted = [id_ for id_ in changes.inserted if id_ not in self.id_row_map]
+        deleted = [id_ for id_ in changes.deleted if id_ in self.id_row_map]
+        if inserted or deleted or len(changes.updated) > ROW_REFRESH_LIMIT:
+            # The rows of the underlying query can only change by reselecting
+            if not self._reselect_in_place(changes.updated):
+                self.select()
+        elif changes.updated:
+            for id_ in changes.updated:
+                self._refresh_row(id_)
+            # Filters evaluated in bulk, with or without a snapshot, are stale
+            self.snapshot_updated.emit()
+            self.bump_version()
+            self.data_updated.emit()
+        if changes.inserted or changes.deleted:
+            self.updateRowCount()
+
+    def _reselect_in_place(self, updated: List[Any]) -> bool:
+        """
+        Reselect the rows, but tell views only about the rows removed and
+        added rather than resetting them, so they keep their scroll position
+        and selection. Returns False if that isn't possible: the model is
+        paged or has pending changes, indexes into it are held, or the
+        remaining rows don't keep their order ahead of the new ones.
+        """
+        if self.paged or self.isDirty() or self.persistentIndexList():
+            return False
+        ids = self._query_ids()
+        if ids is None:
+            return False
+        selected = set(ids)
+        kept = [id_ for id_ in self.id_row_map if id_ in selected]
+        kept.sort(key=self.id_row_map.get)
+        if kept != ids[: len(kept)]:
+            return False
+
+        runs: List[List[int]] = []
+        removed = [row for id_, row in self.id_row_map.items() if id_ not in selected]
+        for row in sorted(removed, reverse=True):
+            if runs and runs[-1][0] == row + 1:
+                runs[-1][0] = row
+            else:
+                runs.append([row, row])
+        for first, last in runs:
+            # The rows are still there until reselecting, so they are hidden
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.hidden_rows += last - first + 1
+            self.endRemoveRows()
+
+        self.hidden_rows = 0
+        self.blockSignals(True)
+        try:
+            reselected = self.select()
+        finally:
+            self.blockSignals(False)
+        if not reselected or self.rowCount() != len(ids):
+            # The rows changed again meanwhile, so views start over
+            self.beginResetModel()
+            self.endResetModel()
+        elif len(ids) > len(kept):
+            self.hidden_rows = len(ids) - len(kept)
+            self.beginInsertRows(QModelIndex(), len(kept), len(ids) - 1)
+            self.hidden_rows = 0
+            self.endInsertRows()
+
+        self.update_snapshot()
+        self.data_updated.emit()
+        rows = [self.id_row_map[id_] for id_ in updated if id_ in self.id_row_map]
+        if rows:
+            self.dataChanged.emit(
+                self.index(min(rows), 0),
+                self.index(max(rows), self.columnCount() - 1),
+            )
+        return True
+
+    def _refresh_row(self, id_: Any) -> None:
+        """Reload a single row from the database"""
+        row = self.id_row_map.get(id_, None)
+        if row is None or row >= self.rowCount():
+            # Rows not fetched yet are read fresh when they are
+            return
+        self.selectRow(row)
+        if self.snapshot is not None:
+            self.snapshot.update_row(self, row)
+
+    def apply_field(self, column: int, value: Any, ids: List[Any]) -> bool:
+        """
+        Set the column to the value for all the given IDs, with one UPDATE per
+        chunk of IDs. For the tags column, each row gets exactly the given tags.
+        """
+        ids = list(dict.fromkeys(ids))
+        table = self.tableName()
+        try:
+            with self.db_context.transaction():
+                if column >= super().columnCount():
+                    tag_ids = [tag.tag_id for tag in value]
+                    if not set_tags_for_bases(self.db_context, ids, tag_ids):
+                        raise TransactionFailed("Failed to set tags")
+                else:
+                    field = self.record().fieldName(column)
+                    if not update_where_in(
+                        self.db_context, table, field, value, "id", ids
+                    ):
+                        raise TransactionFailed(f"Failed to update {field}")
+        except TransactionFailed as exc:
+            logging.error("Failed to apply field to %s: %s", table, exc)
+            return False
+        if column >= super().columnCount():
+            self.set_cached_tags_for(
+                {id_: self.tag_index.updated_tags(id_, value) for id_ in ids}
+            )
+        else:
+            self.apply_changes(RowChanges(updated=ids))
+        return True
+
+    def fetch_all(self) -> None:
+        """Fetch every remaining row from the database"""
+        while self.canFetchMore():
+            self.fetchMore()
+
+    def fetch_to_row(self, row: int) -> None:
+        """Fetch further rows from the database until the given row is loaded"""
+        while self.rowCount() <= row and self.canFetchMore():
+            self.fetchMore()
+
+    def update_tag_cache(self) -> None:
+        """Reload the base ID -> tags cache from the database in one go"""
+        if not self.m2m_relationships:
+            return
+        self._load_tag_index()
+        if self.snapshot is not None:
+            self.snapshot.set_tags(self.tag_index)
+        self.snapshot_rebuilt.emit()
+
+    def _load_tag_index(self) -> None:
+        """Load every base's tags into the tag index"""
+        if not self.m2m_relationships:
+            return
+        self.tag_index.load(get_all_tags_for_bases(self.db_context))
+        self.bump_version()
+
+    def cached_tags(self, id_: str) -> Tuple[Tag, ...]:
+        """Returns the cached tags for the given ID"""
+        return self.tag_index.tags_for(id_)
+
+    def set_cached_tags(self, id_: str, tags: List[Tag]) -> None:
+        """Replace the cached tags for the given ID"""
+        self.set_cached_tags_for({id_: tags})
+
+    def set_cached_tags_for(self, tags_by_id: Dict[Any, List[Tag]]) -> None:
+        """Replace the cached tags of every ID in the map"""
+        rows = []
+        for id_, tags in tags_by_id.items():
+            previous = self.tag_index.tags_for(id_)
+            self.tag_index.set_tags(id_, tags)
+            if id_ not in self.id_row_map:
+                continue
+            rows.append(self.id_row_map[id_])
+            if self.snapshot is not None:
+                self.snapshot.update_tags(rows[-1], previous, tuple(tags))
+        self.bump_version()
+        if not rows:
+            return
+        self.snapshot_updated.emit()
+        last = min(max(rows), self.rowCount() - 1)
+        if min(rows) <= last:
+            column = super().columnCount()
+            self.dataChanged.emit(
+                self.index(min(rows), column), self.index(last, column)
+            )
+
+    def column_filter_clause(
+        self, column_filters: Dict[int, Union[List[Any], ValueRange]]
+    ) -> str:
+        """Compile per-column value and range filters into a SQL WHERE clause"""
+        table = self.tableName()
+        clauses = []
+        for column, values in sorted(column_filters.items()):
+            if values is None:
+                continue
+            if column >= super().columnCount():
+                if column >= self.columnCount():
+                    continue
+                if not values:
+                    # No tags selected means only untagged rows
+                    clauses.append(
+                        "NOT EXISTS (SELECT 1 FROM bases_tags "
+                        + f"WHERE bases_tags.bases_key = {table}.key)"
+                    )
+                for value in values:
+                    clauses.append(
+                        "EXISTS (SELECT 1 FROM bases_tags JOIN tags "
+                        + "ON tags.key = bases_tags.tags_key "
+                        + f"WHERE bases_tags.bases_key = {table}.key "
+                        + f"AND tags.id = {sql_literal(value)})"
+                    )
+                continue
+
+            field = f"{table}.{self.record().fieldName(column)}"
+            if isinstance(values, ValueRange):
+                clauses.append(range_clause(field, values.minimum, values.maximum))
+                continue
+            literals = [sql_literal(value) for value in values if value is not None]
+            options = []
+            if literals:
+                options.append(f"{field} IN ({', '.join(literals)})")
+            if None in values:
+                options.append(f"{field} IS NULL")
+            clauses.append(f"({' OR '.join(options)})" if options else "0")
+        return " AND ".join(clauses)
+
+    def ids_matching(self, clause: str) -> Set[Any]:
+        """Returns the IDs of all rows in the table matching the WHERE clause"""
+        query = f"SELECT id FROM {self.tableName()} WHERE {clause};"
+        result = self.db_context.execute_sql_command(query)
+        if not result:
+            logging.error("Failed to filter %s by %s", self.tableName(), clause)
+            return set()
+        ids = set()
+        while result.next():
+            ids.add(result.value(0))
+        return ids
+
+    def distinct_values(self, column: int) -> List[Tuple[Any, str, int]]:
+        """
+        Returns (value, display text, row count) for each distinct value in the
+        column, cached until this table or the one it links to changes
+        """
+        versions = (self.data_version,)
+        if column in self.linked_models:
+            versions += (self.linked_models[column].data_version,)
+        cached = self.distinct_cache.get(column, None)
+        if cached is None or cached[0] != versions:
+            cached = (versions, self._query_distinct_values(column))
+            self.distinct_cache[column] = cached
+        return cached[1]
+
+    def bump_version(self) -> None:
+        """Mark the data as changed, for caches that depend on it"""
+        self.data_version += 1
+
+    def changed_since(self, version: int) -> bool:
+        """Returns whether the data changed after the given version"""
+        return self.data_version != version
+
+    def _query_distinct_values(self, column: int) -> List[Tuple[Any, str, int]]:
+        """Let the database group the column's values"""
+        table = self.tableName()
+        if column >= super().columnCount():
+            relationship = self.m2m_relationships[column - super().columnCount()]
+            target = relationship.target_table
+            query = f"""
+                SELECT {target}.id, {target}.{relationship.target_field}, COUNT(*)
+                FROM bases_tags
+                JOIN {target} ON {target}.key = bases_tags.tags_key
+                JOIN {table} ON {table}.key = bases_tags.bases_key
+                GROUP BY {target}.id
+            """
+        elif column in self.o2m_relationships:
+            relationship = self.o2m_relationships[column]
+            field = f"{table}.{self.record().fieldName(column)}"
+            target = relationship.target_table
+            query = f"""
+                SELECT {field}, {target}.{relationship.target_field}, COUNT(*)
+                FROM {table}
+                LEFT JOIN {target} ON {target}.{relationship.target_key} = {field}
+                GROUP BY {field}
+            """
+        else:
+            field = f"{table}.{self.record().fieldName(column)}"
+            query = f"SELECT {field}, {field}, COUNT(*) FROM {table} GROUP BY {field}"
+
+        result = self.db_context.execute_sql_command(query)
+        if not result:
+            logging.error("Failed to get distinct values for column %s", column)
+            return []
+        values = []
+        while result.next():
+            value = result.value(0)
+            display = result.value(1)
+            if display is None:
+                display = value
+            if column in self.boolean_fields:
+                display = "Yes" if value == 1 else "No"
+            values.append((value, str(display), result.value(2)))
+        return values
+
+    def update_snapshot(self) -> None:
+        """Drop the column snapshot, it is built again once a filter needs it"""
+        if not self.snapshot_enabled:
+            return
+        self.snapshot = None
+        self.snapshot_rebuilt.emit()
+
+    def current_snapshot(self) -> ColumnSnapshot:
+        """The column snapshot used for bulk filtering, None if paged"""
+        if self.snapshot is None and self.snapshot_enabled and not self.paged:
+            self.snapshot = self._build_snapshot()
+        return self.snapshot
+
+    def _build_snapshot(self) -> ColumnSnapshot:
+        """
+        Snapshot the rows from a single query, which returns the raw values of
+        all of them as one JSON array, rather than reading every record back
+        through data(). Without a snapshot, the filters fall back to the
+        database.
+        """
+        field_count = super().columnCount()
+        # Qt reads NULL as an empty string
+        fields = ", ".join(
+            f"""ifnull("{self.record().fieldName(x)}", '')"""
+            for x in range(field_count)
+        )
+        result = self.db_context.execute_sql_command(
+            f"SELECT json_group_array(json_array({fields})) "
+            + f"FROM ({self.selectStatement()})"
+        )
+        if not result or not result.next():
+            logging.error("Failed to read the rows of %s", self.tableName())
+            return None
+        values = json.loads(result.value(0))
+        result.finish()
+        if len(values) != self.rowCount():
+            logging.error("Rows of %s changed while reading them", self.tableName())
+            return None
+        # Placed by ID, as the aggregate needn't keep the order of the rows
+        rows = [None] * len(values)
+        for row in values:
+            rows[self.id_row_map[row[0]]] = row
+        raw_columns = [
+            column
+            for column in range(field_count)
+            if column not in self.o2m_relationships
+            and column not in self.boolean_fields
+        ]
+        tags = self.tag_index if self.m2m_relationships else None
+        return ColumnSnapshot.from_rows(self, field_count, rows, tags, raw_columns)
 
     def record_by_id(self, id_: str) -> QSqlRecord:
         """Get record by given ID"""
         if id_ not in self.id_row_map:
             logging.error("invalid id %s in record lookup", id_)
             return self.record()
+        self.fetch_to_row(self.id_row_map[id_])
         return self.record(self.id_row_map[id_])
 
     def index_by_id(self, id_: str, field: str) -> QModelIndex:
         """Get index by given ID for field"""
+        self.fetch_to_row(self.id_row_map[id_])
         return self.field_index(self.id_row_map[id_], field)
 
     def select(self) -> bool:
         """Reload all data from the database"""
+        self.snapshot = None
         retval = super().select()
+        self.bump_version()
         self.update_id_row_map()
+        self.paged = self.fetch_policy == FETCH_ON_DEMAND or (
+            self.paged_threshold is not None
+            and len(self.id_row_map) > self.paged_threshold
+        )
+        if not self.paged:
+            self.fetch_all()
+        self._load_tag_index()
+        self.update_snapshot()
         self.data_updated.emit()
         return retval
 
@@ -84,7 +539,7 @@ class RelationalModel(QSqlTableModel):
             return None
 
         source_id = idx.siblingAtColumn(0).data()
-        values = get_tags_for_base(self.db_context, source_id)
+        values = list(self.cached_tags(source_id))
         names = [value.tag_name for value in values]
         return {
             Qt.ItemDataRole.DisplayRole: ",".join(names),
@@ -100,16 +555,17 @@ class RelationalModel(QSqlTableModel):
             return foreign_key
         if foreign_key is None:
             return None
+        if idx.column() in self.o2m_lookups:
+            return self.o2m_lookups[idx.column()].get(foreign_key, foreign_key)
         relationship = self.o2m_relationships[idx.column()]
         query = f"""
             SELECT {relationship.target_field} 
             FROM {relationship.target_table}
-            WHERE {relationship.target_key} == "{foreign_key}"
+            WHERE {relationship.target_key} == :foreign_key
         """
-        sql = QSqlQuery()
-        sql.prepare(query)
-        success = sql.exec()
-        if not success:
+        bindings = [QueryBinding(":foreign_key", foreign_key)]
+        sql: QSqlQuery = self.db_context.execute_sql_command(query, bindings)
+        if not sql:
             logging.error("_data_o2m: Failed to get value. Query: %s", query)
             return None
         success = sql.next()
@@ -176,10 +632,16 @@ class RelationalModel(QSqlTableModel):
             return False
 
         source_id = index.siblingAtColumn(0).data()
-        remove_all_tags_for_base(self.db_context, source_id)
         tags: List[Tag] = value
-        for tag in tags:
-            add_tag_to_base(self.db_context, source_id, tag.tag_id)
+        try:
+            with self.db_context.transaction():
+                tag_ids = [tag.tag_id for tag in tags]
+                if not set_tags_for_bases(self.db_context, [source_id], tag_ids):
+                    raise TransactionFailed(f"Failed to set tags for {source_id}")
+        except TransactionFailed as exc:
+            logging.error(exc)
+            return False
+        self.set_cached_tags(source_id, self.tag_index.updated_tags(source_id, tags))
         return True
 
     # pylint: disable=invalid-name
@@ -191,9 +653,68 @@ class RelationalModel(QSqlTableModel):
         if index.column() >= super().columnCount():
             return self._set_data_m2m(index, value, role)
         if index.column() in self.o2m_relationships:
-            return self._set_data_o2m(index, value, role)
+            retval = self._set_data_o2m(index, value, role)
+        else:
+            retval = super().setData(index, value, role=role)
+        if retval:
+            self.bump_version()
+        return retval
+
+    def submitAll(self) -> bool:
+        """Submit pending changes, marking the data as changed"""
+        retval = super().submitAll()
+        self.bump_version()
+        return retval
+
+    def insertRows(self, row: int, count: int, parent=QModelIndex()) -> bool:
+        """Move the rows after newly inserted ones down in the ID map"""
+        if not super().insertRows(row, count, parent):
+            return False
+        self.bump_version()
+        for id_, id_row in self.id_row_map.items():
+            if id_row >= row:
+                self.id_row_map[id_] = id_row + count
+        return True
+
+    def removeRows(self, row: int, count: int, parent=QModelIndex()) -> bool:
+        """Drop rows that are gone from the ID map and move the ones after up"""
+        row_count = self.rowCount()
+        if not super().removeRows(row, count, parent):
+            return False
+        self.bump_version()
+        if self.rowCount() == row_count:
+            # Existing rows stay in place until they are submitted
+            return True
+        id_row_map = {}
+        for id_, id_row in self.id_row_map.items():
+            if id_row >= row + count:
+                id_row_map[id_] = id_row - count
+            elif id_row < row:
+                id_row_map[id_] = id_row
+        self.id_row_map = id_row_map
+        return True
+
+    def insertRecord(self, row: int, record: QSqlRecord) -> bool:
+        """Add the new row to the ID map"""
+        for field in INTERNAL_FIELDS:
+            if record.contains(field) and record.isNull(field):
+                # Let the database assign the key
+                record.setGenerated(field, False)
+        if not super().insertRecord(row, record):
+            return False
+        if record.isNull(0):
+            return True
+        self.id_row_map[record.value(0)] = row if row >= 0 else self.rowCount() - 1
+        return True
+
+    def orderByClause(self) -> str:
+        """Keep rows in insertion order, so row numbers match the ID map"""
+        clause = super().orderByClause()
+        return clause if clause else f"ORDER BY {self.tableName()}.rowid"
 
-        return super().setData(index, value, role=role)
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        """Leave out rows that views haven't been told about yet"""
+        return super().rowCount(parent) - self.hidden_rows
 
     def columnCount(self, _: QModelIndex = None) -> int:
         """Override for the column count"""
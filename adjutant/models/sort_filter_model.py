@@ -1,11 +1,19 @@
 """ The overlying filter model for use with the Bases table """
 
-from dataclasses import dataclass
-from typing import Any, Dict, List
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Set, Tuple, Union
 import yaml
-from PyQt6.QtCore import QModelIndex, QSortFilterProxyModel, Qt, pyqtSignal
+from PyQt6.QtCore import (
+    QAbstractItemModel,
+    QModelIndex,
+    QSortFilterProxyModel,
+    Qt,
+    pyqtSignal,
+)
 from PyQt6.QtGui import QIcon
-from adjutant.context.dataclasses import Tag
+from adjutant.context.dataclasses import Tag, ValueRange
+from adjutant.models.column_snapshot import ColumnSnapshot, display_text, in_range
+from adjutant.models.relational_model import RelationalModel
 
 
 @dataclass
@@ -25,15 +33,146 @@ class SortFilterModel(QSortFilterProxyModel):
         super().__init__(parent=parent)
         self.column_filters: Dict[int, List[str]] = {}
         self.hide_zero_id = True
+        self.filter_text = ""
+        self.matching_ids: Set[Any] = None
+        self.accepted_rows: bytes = None
+        self.awaiting_snapshot = False
+        self.text_matches: Dict[int, List[Any]] = None
+        self.text_query: Tuple[str, int, bool] = None
+        self.search_texts: Dict[int, str] = {}
 
-    def set_column_filter(self, column: int, values: List[Any]) -> None:
-        """Set the filter for a given column"""
+    def evaluate_filters(self) -> None:
+        """Evaluate the filters in bulk, wherever the source model allows it"""
+        model = self.sourceModel()
+        self.matching_ids = None
+        self.accepted_rows = None
+        snapshot: ColumnSnapshot = None
+        if isinstance(model, RelationalModel) and self._has_filters():
+            # Without filters, hiding the zero ID is quicker row by row
+            snapshot = model.current_snapshot()
+        if snapshot is not None:
+            self.accepted_rows = snapshot.accepted_rows(self._snapshot_mask(snapshot))
+        elif isinstance(model, RelationalModel):
+            # Let the database evaluate the column filters
+            clause = model.column_filter_clause(self.column_filters)
+            self.matching_ids = model.ids_matching(clause) if clause else None
+
+    def _has_filters(self) -> bool:
+        """Whether any column filter or the filter text is set"""
+        return bool(self.filter_text) or any(
+            values is not None for values in self.column_filters.values()
+        )
+
+    def _snapshot_mask(self, snapshot: ColumnSnapshot) -> int:
+        """Combine all filters into a single mask over the snapshot's rows"""
+        mask = snapshot.all_rows
+        if self.hide_zero_id:
+            mask &= ~snapshot.value_mask(0, "")
+        for column, values in self.column_filters.items():
+            if values is not None and column < self.sourceModel().columnCount():
+                mask &= snapshot.column_mask(column, values)
+        if self.filter_text:
+            mask &= snapshot.matches_mask(self._text_matches(snapshot))
+        return mask
+
+    def _text_matches(self, snapshot: ColumnSnapshot) -> Dict[int, List[Any]]:
+        """
+        Match the filter text against the snapshot. When the text extends the
+        previous one, only the values that matched before are tested again.
+        """
+        case_sensitive = self._case_sensitive()
+        text = self.filter_text if case_sensitive else self.filter_text.casefold()
+        query = (text, self.filterKeyColumn(), case_sensitive)
+        within = None
+        if (
+            self.text_matches is not None
+            and self.text_query[1:] == query[1:]
+            and self.text_query[0] in text
+        ):
+            within = self.text_matches
+        self.text_matches = snapshot.text_matches(
+            text, query[1], case_sensitive, within
+        )
+        self.text_query = query
+        return self.text_matches
+
+    def _source_about_to_be_reset(self) -> None:
+        """The source is being reselected, so bulk results are out of date"""
+        self.text_matches = None
+        if getattr(self.sourceModel(), "snapshot_enabled", False):
+            # Accept everything until the new snapshot is built
+            self.awaiting_snapshot = True
+            self.accepted_rows = None
+        else:
+            self.evaluate_filters()
+
+    def _source_snapshot_updated(self) -> None:
+        """The source's rows or snapshot changed, so bulk results are stale"""
+        self.text_matches = None
+        self.text_query = None
+        self.awaiting_snapshot = False
+        self.evaluate_filters()
+        self.invalidateFilter()
+
+    def _source_snapshot_rebuilt(self) -> None:
+        """Any row may have changed, so every search text is out of date"""
+        self._clear_search_texts()
+        self._source_snapshot_updated()
+
+    def _case_sensitive(self) -> bool:
+        """Whether the filter text is matched case-sensitively"""
+        return self.filterCaseSensitivity() == Qt.CaseSensitivity.CaseSensitive
+
+    def search_text(self, source_row: int) -> str:
+        """The row's searchable display values, cached until the row changes"""
+        if source_row not in self.search_texts:
+            model = self.sourceModel()
+            columns = (
+                range(model.columnCount())
+                if self.filterKeyColumn() == -1
+                else [self.filterKeyColumn()]
+            )
+            text = "\0".join(
+                display_text(model.index(source_row, column).data(self.filterRole()))
+                for column in columns
+            )
+            self.search_texts[source_row] = (
+                text if self._case_sensitive() else text.casefold()
+            )
+        return self.search_texts[source_row]
+
+    def _clear_search_texts(self, first: int = 0) -> None:
+        """Forget the cached search text from the given row onwards"""
+        if first == 0:
+            self.search_texts = {}
+            return
+        for row in [row for row in self.search_texts if row >= first]:
+            del self.search_texts[row]
+
+    def _source_data_changed(self, top_left: QModelIndex, bottom_right: QModelIndex):
+        """Forget the search text of the changed rows"""
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self.search_texts.pop(row, None)
+
+    def _source_layout_changed(self) -> None:
+        """Every row may have changed or moved"""
+        self._clear_search_texts()
+
+    def _source_rows_moved(self, _: QModelIndex, first: int, __: int) -> None:
+        """Rows from first onwards have shifted, so their search text is stale"""
+        self._clear_search_texts(first)
+
+    def set_column_filter(
+        self, column: int, values: Union[List[Any], ValueRange]
+    ) -> None:
+        """Set the filter for a given column, as the values or a range to accept"""
         self.column_filters[column] = values
+        self.evaluate_filters()
         self.invalidateFilter()
         self.headerDataChanged.emit(Qt.Orientation.Horizontal, column, column)
         self.filter_changed.emit()
 
-    def get_column_filter(self, column: int) -> List[str]:
+    def get_column_filter(self, column: int) -> Union[List[Any], ValueRange]:
         """Get the list of filter for the column"""
         return self.column_filters.get(column, None)
 
@@ -47,17 +186,55 @@ class SortFilterModel(QSortFilterProxyModel):
         """Encode the filters in a binary format"""
         wrapper = {}
         wrapper["regex"] = self.filterRegularExpression().pattern()
-        wrapper["column_filters"] = self.column_filters
+        wrapper["column_filters"] = {
+            column: asdict(values) if isinstance(values, ValueRange) else values
+            for column, values in self.column_filters.items()
+        }
         return yaml.dump(wrapper)
 
     def decode_filters(self, encoded: str):
         """Decode the filters from binary format"""
         wrapper: dict = yaml.safe_load(encoded)
         self.setFilterFixedString(wrapper["regex"])
-        self.column_filters = wrapper["column_filters"]
+        self.column_filters = {
+            column: ValueRange(**values) if isinstance(values, dict) else values
+            for column, values in wrapper["column_filters"].items()
+        }
+        self.evaluate_filters()
         self.invalidateFilter()
 
     # pylint: disable=invalid-name
+    def setSourceModel(self, model: QAbstractItemModel) -> None:
+        """Re-evaluate the filters whenever a relational source is reselected"""
+        previous = self.sourceModel()
+        if previous is not None:
+            previous.dataChanged.disconnect(self._source_data_changed)
+            previous.rowsInserted.disconnect(self._source_rows_moved)
+            previous.rowsRemoved.disconnect(self._source_rows_moved)
+            previous.modelReset.disconnect(self._source_layout_changed)
+            previous.layoutChanged.disconnect(self._source_layout_changed)
+        if isinstance(previous, RelationalModel):
+            previous.modelAboutToBeReset.disconnect(self._source_about_to_be_reset)
+            previous.snapshot_updated.disconnect(self._source_snapshot_updated)
+            previous.snapshot_rebuilt.disconnect(self._source_snapshot_rebuilt)
+        self.text_matches = None
+        self._clear_search_texts()
+        if model is not None:
+            # Connected ahead of the proxy itself, so rows are refiltered
+            # with fresh search texts
+            model.dataChanged.connect(self._source_data_changed)
+            model.rowsInserted.connect(self._source_rows_moved)
+            model.rowsRemoved.connect(self._source_rows_moved)
+            model.modelReset.connect(self._source_layout_changed)
+            model.layoutChanged.connect(self._source_layout_changed)
+        super().setSourceModel(model)
+        if isinstance(model, RelationalModel):
+            model.modelAboutToBeReset.connect(self._source_about_to_be_reset)
+            model.snapshot_updated.connect(self._source_snapshot_updated)
+            model.snapshot_rebuilt.connect(self._source_snapshot_rebuilt)
+        self.evaluate_filters()
+        self.invalidateFilter()
+
     def headerData(self, section: int, orientation: Qt.Orientation, role: int):
         """Override to set filter icon"""
         if role == Qt.ItemDataRole.DecorationRole:
@@ -71,36 +248,79 @@ class SortFilterModel(QSortFilterProxyModel):
 
     def setFilterFixedString(self, pattern: str) -> None:
         """Filter the model by the given string"""
+        self.filter_text = pattern
+        self.evaluate_filters()
         super().setFilterFixedString(pattern)
         self.filter_changed.emit()
 
+    def setFilterKeyColumn(self, column: int) -> None:
+        """Searching other columns needs new search texts"""
+        self._clear_search_texts()
+        super().setFilterKeyColumn(column)
+        self._refilter_text()
+
+    def setFilterCaseSensitivity(self, sensitivity: Qt.CaseSensitivity) -> None:
+        """Folding the search texts depends on the case sensitivity"""
+        self._clear_search_texts()
+        super().setFilterCaseSensitivity(sensitivity)
+        self._refilter_text()
+
+    def _refilter_text(self) -> None:
+        """Re-apply the filter text after its matching rules changed"""
+        if not self.filter_text:
+            return
+        self.evaluate_filters()
+        self.invalidateFilter()
+
     def filterAcceptsRow(self, source_row: int, parent: QModelIndex = None) -> bool:
         """returns True if the row should be shown"""
         if parent is None:
             parent = QModelIndex()
 
+        if self.awaiting_snapshot:
+            return True
+        if self.accepted_rows is not None and source_row < len(self.accepted_rows):
+            return self.accepted_rows[source_row] != 0
+
         uuid = self.sourceModel().index(source_row, 0).data()
         if uuid == "" and self.hide_zero_id:
             return False
+        if isinstance(self.sourceModel(), RelationalModel):
+            if self.matching_ids is not None and uuid not in self.matching_ids:
+                return False
+        elif not self._accepts_column_filters(source_row):
+            return False
+
+        if not self.filter_text:
+            return super().filterAcceptsRow(source_row, parent)
+        text = (
+            self.filter_text if self._case_sensitive() else self.filter_text.casefold()
+        )
+        return text in self.search_text(source_row)
+
+    def _accepts_column_filters(self, source_row: int) -> bool:
+        """Evaluate the column filters against the source row's data"""
         for column in range(self.sourceModel().columnCount()):
             filter_list = self.column_filters.get(column, None)
+            if filter_list is None:
+                continue
             value = (
                 self.sourceModel()
                 .index(source_row, column)
                 .data(Qt.ItemDataRole.EditRole)
             )
-            if isinstance(value, list):
-                if filter_list is not None:
-                    filter_set = set(filter_list)
-                    value: List[Tag] = value
-                    value_set = {tag.tag_id for tag in value}
-                    if not filter_set and value_set:
-                        # No filters, but tags
-                        return False
-                    if not filter_set.issubset(value_set):
-                        return False
-            else:
-                if filter_list is not None and value not in filter_list:
+            if isinstance(filter_list, ValueRange):
+                if not in_range(value, filter_list):
                     return False
-
-        return super().filterAcceptsRow(source_row, parent)
+            elif isinstance(value, list):
+                filter_set = set(filter_list)
+                value: List[Tag] = value
+                value_set = {tag.tag_id for tag in value}
+                if not filter_set and value_set:
+                    # No filters, but tags
+                    return False
+                if not filter_set.issubset(value_set):
+                    return False
+            elif value not in filter_list:
+                return False
+        return True
@@ -0,0 +1,72 @@
+""" Inverted index from tags to the bases using them """
+
+from typing import Any, Dict, Iterable, List, Set, Tuple
+from adjutant.context.dataclasses import Tag
+
+
+class TagIndex:
+    """
+    Keeps the tags of every base together with a posting list of bases for
+    every tag, so bases having all of a set of tags are found by intersecting
+    the posting lists.
+    """
+
+    def __init__(self) -> None:
+        self.tags: Dict[Any, Tuple[Tag, ...]] = {}
+        self.postings: Dict[Any, Set[Any]] = {}
+
+    def load(self, tags: Dict[Any, Tuple[Tag, ...]]) -> None:
+        """Replace the index with the given base ID -> tags map"""
+        self.tags = {}
+        self.postings = {}
+        for base_id, base_tags in tags.items():
+            self.set_tags(base_id, base_tags)
+
+    def tags_for(self, base_id: Any) -> Tuple[Tag, ...]:
+        """Returns the tags of the given base"""
+        return self.tags.get(base_id, ())
+
+    def set_tags(self, base_id: Any, tags: Iterable[Tag]) -> None:
+        """Replace the tags of the given base"""
+        tags = tuple(tags)
+        previous = {tag.tag_id for tag in self.tags.pop(base_id, ())}
+        current = {tag.tag_id for tag in tags}
+        for tag_id in previous - current:
+            self.postings[tag_id].discard(base_id)
+            if not self.postings[tag_id]:
+                del self.postings[tag_id]
+        for tag_id in current - previous:
+            self.postings.setdefault(tag_id, set()).add(base_id)
+        if tags:
+            self.tags[base_id] = tags
+
+    def updated_tags(self, base_id: Any, tags: Iterable[Tag]) -> Tuple[Tag, ...]:
+        """
+        The base's tags once only the differences to the given tags are
+        applied: the kept tags in their order, then the added ones
+        """
+        wanted = {tag.tag_id for tag in tags}
+        kept = [tag for tag in self.tags_for(base_id) if tag.tag_id in wanted]
+        existing = {tag.tag_id for tag in kept}
+        return tuple(kept + [tag for tag in tags if tag.tag_id not in existing])
+
+    def rename_tags(self, names: Dict[Any, str]) -> None:
+        """Apply the current tag names, dropping tags that no longer exist"""
+        for tag_id in [tag_id for tag_id in self.postings if tag_id not in names]:
+            for base_id in list(self.postings[tag_id]):
+                self.set_tags(
+                    base_id, [x for x in self.tags[base_id] if x.tag_id != tag_id]
+                )
+        for base_id, tags in self.tags.items():
+            self.tags[base_id] = tuple(Tag(x.tag_id, names[x.tag_id]) for x in tags)
+
+    def bases_for_tag(self, tag_id: Any) -> Set[Any]:
+        """Returns the IDs of all bases with the given tag"""
+        return self.postings.get(tag_id, set())
+
+    def bases_with_all(self, tag_ids: List[Any]) -> Set[Any]:
+        """Returns the IDs of the bases that have every one of the tags"""
+        postings = sorted((self.bases_for_tag(x) for x in tag_ids), key=len)
+        if not postings:
+            return set()
+        return postings[0].intersection(*postings[1:])
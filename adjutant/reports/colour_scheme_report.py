@@ -54,6 +54,7 @@ class ColourSchemeReport(BaseReport):
         <h2>Usage</h2>
         """
         usage_map = {}
+        self.context.models.bases_model.fetch_all()
         for row in range(self.context.models.bases_model.rowCount()):
             base = self.context.models.bases_model.record(row)
             if base.value("schemes_id") != self.scheme_id:
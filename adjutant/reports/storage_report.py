@@ -25,6 +25,7 @@ class StorageReport(BaseReport):
             self.storages.append(self.model.record(row))
         self.storages.sort(key=lambda r: r.field("name").value())
 
+        self.context.models.bases_model.fetch_all()
         for row in range(self.context.models.bases_model.rowCount()):
             record = self.context.models.bases_model.record(row)
             storage_id = record.field("storages_id").value() or ""
@@ -2,6 +2,7 @@
 
 import functools
 
+from PyQt6.QtCore import QTimer, pyqtSignal
 from PyQt6.QtGui import QAction
 from PyQt6.QtWidgets import (
     QWidget,
@@ -15,14 +16,19 @@ from PyQt6.QtWidgets import (
 
 from adjutant.context.context import Context
 
+FILTER_DELAY_MS = 250
+
 
 class SearchBar(QWidget):
     """The Search bar"""
 
+    filter_text_changed = pyqtSignal(str)
+
     def __init__(self, context: Context, parent: QWidget = None) -> None:
         super().__init__(parent=parent)
         self.context = context
         self.filter_edit = QLineEdit()
+        self.filter_timer = QTimer(self)
         self.clear_button = QPushButton(self.tr("Clear Filters"))
         self.save_button = QPushButton(self.tr("Save Search"))
         self.load_button = QToolButton()
@@ -47,9 +53,14 @@ class SearchBar(QWidget):
         self.load_button.setText(self.tr("Load Search"))
         self.load_button.setPopupMode(QToolButton.ToolButtonPopupMode.MenuButtonPopup)
         self.create_load_menu()
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DELAY_MS)
 
     def _setup_signals(self):
-        self.clear_button.pressed.connect(lambda: self.filter_edit.setText(""))
+        self.clear_button.pressed.connect(self.clear_filter)
+        # Restarting the timer drops the pass queued by the previous keystroke
+        self.filter_edit.textChanged.connect(self.filter_timer.start)
+        self.filter_timer.timeout.connect(self.apply_filter)
 
         self.context.models.searches_model.data_updated.connect(self.create_load_menu)
         self.load_button.pressed.connect(self.load_button.showMenu)
@@ -68,8 +79,19 @@ class SearchBar(QWidget):
             load_menu.addAction(load_action)
         self.load_button.setMenu(load_menu)
 
+    def apply_filter(self):
+        """Apply the filter text now instead of waiting for the timer"""
+        self.filter_timer.stop()
+        self.filter_text_changed.emit(self.filter_edit.text())
+
+    def clear_filter(self):
+        """Clear the filter text without delay"""
+        self.filter_edit.setText("")
+        self.apply_filter()
+
     def load_search(self, search_text: str):
         """Restore a saved search"""
+        self.filter_timer.stop()
         self.filter_edit.blockSignals(True)
         self.filter_edit.setText(search_text)
         self.filter_edit.blockSignals(False)
@@ -12,6 +12,7 @@ from PyQt6.QtCore import (
 from PyQt6.QtGui import QContextMenuEvent, QKeyEvent, QCursor, QAction
 from PyQt6.QtWidgets import QTableView, QMenu
 from adjutant.context.context import Context
+from adjutant.context.database_context import INTERNAL_FIELDS
 from adjutant.models.relational_model import RelationalModel
 from adjutant.models.sort_filter_model import SortFilterModel
 from adjutant.widgets.sort_filter_header import SortFilterHeader
@@ -20,12 +21,11 @@ from adjutant.widgets.sort_filter_header import SortFilterHeader
 def apply_field_to_index_list(source: QModelIndex, destination: List[QModelIndex]):
     """Apply the data from the source index to the same field in the destination list"""
     model: RelationalModel = source.model()
-    for index in destination:
-        model.setData(
-            index.siblingAtColumn(source.column()),
-            source.data(Qt.ItemDataRole.EditRole),
-        )
-    model.submitAll()
+    model.apply_field(
+        source.column(),
+        source.data(Qt.ItemDataRole.EditRole),
+        [index.siblingAtColumn(0).data() for index in destination],
+    )
 
 
 class SortFilterTable(QTableView):
@@ -75,6 +75,9 @@ class SortFilterTable(QTableView):
         self.filter_model.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
 
         super().setModel(self.filter_model)
+        record = model.record()
+        for column in range(record.count()):
+            self.setColumnHidden(column, record.fieldName(column) in INTERNAL_FIELDS)
         self.resizeColumnsToContents()
 
         emit_count = lambda: self.row_count_changed.emit(self.filter_model.rowCount())
@@ -96,6 +99,8 @@ class SortFilterTable(QTableView):
         """Setup the "Filter to Selection" menu"""
         filter_menu = QMenu(self.tr("Filter to Selection"), self)
         for column in range(1, self.model().columnCount()):
+            if self.isColumnHidden(column):
+                continue
             filter_action = QAction(self.generate_title(index, column), filter_menu)
             filter_action.triggered.connect(
                 functools.partial(
@@ -111,6 +116,8 @@ class SortFilterTable(QTableView):
         """Setup the "Apply to Selection" menu"""
         apply_menu = QMenu(self.tr("Apply to Selection"), self)
         for column in range(1, self.model().columnCount()):
+            if self.isColumnHidden(column):
+                continue
             apply_action = QAction(self.generate_title(index, column), apply_menu)
             apply_action.triggered.connect(
                 functools.partial(
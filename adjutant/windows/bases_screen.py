@@ -32,7 +32,7 @@ class BasesScreen(QWidget):
 
     def _setup_signals(self):
         """Setup the signals"""
-        self.search_bar.filter_edit.textChanged.connect(
+        self.search_bar.filter_text_changed.connect(
             self.table.filter_model.setFilterFixedString
         )
         self.search_bar.clear_button.pressed.connect(self.table.clear_all_filters)
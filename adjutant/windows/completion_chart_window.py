@@ -12,9 +12,9 @@ from PyQt6.QtWidgets import (
     QLabel,
 )
 from PyQt6.QtCharts import QChart, QChartView, QLineSeries, QBarCategoryAxis, QValueAxis
-from PyQt6.QtSql import QSqlRecord
 
 from adjutant.context import Context
+from adjutant.context.database_context import count_per_month
 
 MONTH_AXIS = [
     "Jan",
@@ -118,20 +118,15 @@ class CompletionChartWindow(QDialog):
         """Load data from bases"""
         self.data = Data()
 
-        model = self.context.models.bases_model
-        for row in range(model.rowCount()):
-            record: QSqlRecord = model.record(row)
-            completed: str = record.value("date_completed")
-            if completed == "":
-                continue
-            (year, month, _) = completed.split("-")
+        counts = count_per_month(self.context.database, "bases", "date_completed")
+        for (year, month), count in counts.items():
             if not year in self.data.completion:
                 self.data.years.insert(0, year)
                 self.data.completion[year] = {}
                 for mon in NUMERIC_MONTHS:
                     self.data.completion[year][mon] = 0
 
-            self.data.completion[year][month] = self.data.completion[year][month] + 1
+            self.data.completion[year][month] = count
 
         self.data.years.sort()
         self.widgets.year_select.clear()
@@ -1,9 +1,13 @@
 """ Popup filter for the bases table header """
 
-from dataclasses import dataclass
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date
 from typing import Any, List
 from PyQt6.QtCore import QSortFilterProxyModel, Qt
 from PyQt6.QtGui import QCursor, QStandardItem, QStandardItemModel, QIcon
+from PyQt6.QtSql import QSqlTableModel
 from PyQt6.QtWidgets import (
     QDialog,
     QHBoxLayout,
@@ -13,16 +17,23 @@ from PyQt6.QtWidgets import (
     QWidget,
     QLineEdit,
 )
-from adjutant.context.dataclasses import Tag
+from adjutant.context.dataclasses import Tag, ValueRange
+from adjutant.models.relational_model import RelationalModel
 from adjutant.models.sort_filter_model import SortFilterModel
 
 
+# Fields filtered by a range of values, rather than by picking each value
+NUMBER_RANGE_FIELDS = ["price", "width", "depth", "figures"]
+DATE_RANGE_FIELDS = ["date_added", "date_acquired", "date_completed"]
+
+
 @dataclass(eq=True, frozen=True)
 class FilterValue:
     """Filter text and data value"""
 
     text: str
     value: Any
+    count: int = field(default=0, compare=False)
 
     def __lt__(self, other):
         return self.text < other.text
@@ -40,6 +51,20 @@ def to_check_state(value: bool) -> Qt.CheckState:
     return Qt.CheckState.Unchecked
 
 
+def parse_bound(text: str, dates: bool) -> Any:
+    """Convert the text of a range bound, None if empty or invalid"""
+    try:
+        if dates:
+            return date.fromisoformat(text.strip()).isoformat()
+        number = float(text)
+    except ValueError:
+        return None
+    # float() also reads inf and nan, which are no bound in SQL
+    if not math.isfinite(number):
+        return None
+    return int(number) if number.is_integer() else number
+
+
 def invert_check_state(value: Qt.CheckState) -> Qt.CheckState:
     """Toggles the checkstate value"""
     if value == Qt.CheckState.Checked:
@@ -67,12 +92,16 @@ class FilterPopup(QDialog):
             "cancel": QPushButton(self.tr("Cancel")),
         }
         self.filter = QLineEdit()
+        self.range_edits = {"minimum": QLineEdit(), "maximum": QLineEdit()}
 
         self.list_widget = QListView()
         self.list_model = QStandardItemModel()
         self.sort_model = QSortFilterProxyModel()
         self.model = model
         self.column = column
+        field_name = self.field_name()
+        self.dates = field_name in DATE_RANGE_FIELDS
+        self.ranged = self.dates or field_name in NUMBER_RANGE_FIELDS
 
         self._setup_layout()
         self._setup_widgets()
@@ -96,6 +125,10 @@ class FilterPopup(QDialog):
         central.addWidget(self.buttons["sort_descending"])
         central.addWidget(QWidget())
         central.addLayout(select_button_layout)
+        range_layout = QHBoxLayout()
+        range_layout.addWidget(self.range_edits["minimum"])
+        range_layout.addWidget(self.range_edits["maximum"])
+        central.addLayout(range_layout)
         central.addWidget(self.filter)
         central.addWidget(self.list_widget)
         central.addLayout(button_layout)
@@ -117,6 +150,21 @@ class FilterPopup(QDialog):
                 self.model.sortOrder() == Qt.SortOrder.DescendingOrder
             )
         self.filter.setClearButtonEnabled(True)
+        placeholders = {
+            "minimum": self.tr("On or after") if self.dates else self.tr("Minimum"),
+            "maximum": self.tr("On or before") if self.dates else self.tr("Maximum"),
+        }
+        for name, edit in self.range_edits.items():
+            edit.setPlaceholderText(placeholders[name])
+            edit.setClearButtonEnabled(True)
+            edit.setVisible(self.ranged)
+
+    def field_name(self) -> str:
+        """Name of the column's field, empty if the source has no fields"""
+        source = self.model.sourceModel()
+        if not isinstance(source, QSqlTableModel):
+            return ""
+        return source.record().fieldName(self.column)
 
     def _setup_signals(self):
         """Connect signals"""
@@ -148,10 +196,14 @@ class FilterPopup(QDialog):
         else:
             self.model.sort(-1, Qt.SortOrder.DescendingOrder)
 
-    def setup_filter(self) -> None:
-        """Retrieves unique items from model at that column"""
-        current_filters = self.model.get_column_filter(self.column)
+    def distinct_values(self) -> List[FilterValue]:
+        """Unique values in the column, with the number of rows for each"""
         model = self.model.sourceModel()
+        if isinstance(model, RelationalModel):
+            return [
+                FilterValue(text, value, count)
+                for value, text, count in model.distinct_values(self.column)
+            ]
 
         items: List[FilterValue] = []
         for row in range(model.rowCount()):
@@ -165,11 +217,22 @@ class FilterPopup(QDialog):
                     items.append(FilterValue(tag.tag_name, tag.tag_id))
             else:
                 items.append(FilterValue(str(display), value))
-        unique = list(set(items))
+        counts = Counter(items)
+        return [FilterValue(x.text, x.value, count) for x, count in counts.items()]
+
+    def setup_filter(self) -> None:
+        """Retrieves unique items from model at that column"""
+        current_filters = self.model.get_column_filter(self.column)
+        if isinstance(current_filters, ValueRange):
+            for name, edit in self.range_edits.items():
+                bound = getattr(current_filters, name)
+                edit.setText("" if bound is None else str(bound))
+            current_filters = None
+        unique = self.distinct_values()
         unique.sort()
 
         for filter_ in unique:
-            item = QStandardItem(filter_.text)
+            item = QStandardItem(f"{filter_.text} ({filter_.count})")
             item.setCheckable(True)
             checked = not (
                 current_filters is not None and filter_.value not in current_filters
@@ -201,8 +264,23 @@ class FilterPopup(QDialog):
             item = self.list_model.item(self.sort_model.mapToSource(index).row(), 0)
             item.setCheckState(Qt.CheckState.Checked)
 
+    def value_range(self) -> ValueRange:
+        """The range entered for the column, None if neither bound is given"""
+        if not self.ranged:
+            return None
+        minimum = parse_bound(self.range_edits["minimum"].text(), self.dates)
+        maximum = parse_bound(self.range_edits["maximum"].text(), self.dates)
+        if minimum is None and maximum is None:
+            return None
+        return ValueRange(minimum, maximum)
+
     def update_filters(self):
         """Update the filters for this column on the filter model"""
+        value_range = self.value_range()
+        if value_range is not None:
+            self.model.set_column_filter(self.column, value_range)
+            return
+
         filter_list = []
         for row in range(self.list_model.rowCount()):
             item = self.list_model.item(row, 0)
@@ -120,7 +120,7 @@ class MainWindow(QMainWindow):
 
         logging.debug("Loading database")
         try:
-            self.context.database.open_database()
+            self.context.database.open_database(self.context.settings.database_profile)
         except NoDatabaseFileFound:
             self.first_time = True
             self.context.database.migrate()
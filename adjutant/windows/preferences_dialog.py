@@ -22,6 +22,7 @@ class PreferencesDialog(QDialog):
         self.setWindowTitle("Preferences")
 
         self.font_size = QComboBox()
+        self.database_profile = QComboBox()
         self.close_button = QPushButton(self.tr("Close"))
 
         self._setup_layout()
@@ -36,6 +37,7 @@ class PreferencesDialog(QDialog):
 
         form_layout = QFormLayout()
         form_layout.addRow("Font Size: ", self.font_size)
+        form_layout.addRow("Database Profile: ", self.database_profile)
         form_layout.addRow("", None)
 
         central = QVBoxLayout()
@@ -52,17 +54,32 @@ class PreferencesDialog(QDialog):
             if size == current_font_size:
                 self.font_size.setCurrentIndex(size - 5)
 
+        self.database_profile.addItem(self.tr("Safe"), "safe")
+        self.database_profile.addItem(self.tr("Fast"), "fast")
+        self.database_profile.setToolTip(
+            self.tr("Fast trades some durability on power loss for speed")
+        )
+        self.database_profile.setCurrentIndex(
+            self.database_profile.findData(self.context.settings.database_profile)
+        )
+
     def _setup_signals(self):
         """Setup the signals"""
         self.close_button.pressed.connect(self.accept)
 
         self.font_size.activated.connect(self.font_size_changed)
+        self.database_profile.activated.connect(self.database_profile_changed)
 
     def font_size_changed(self):
         """Font size has been updated"""
         new_size = self.font_size.currentData(Qt.ItemDataRole.UserRole)
         self.context.controller.set_font_size(new_size)
 
+    def database_profile_changed(self):
+        """Database profile has been updated"""
+        profile = self.database_profile.currentData(Qt.ItemDataRole.UserRole)
+        self.context.controller.set_database_profile(profile)
+
     @classmethod
     def show(cls, parent, context):
         """Show the dialog"""
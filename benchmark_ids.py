@@ -0,0 +1,73 @@
+""" Script comparing random and time-ordered IDs for inserting bases """
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from adjutant.context.database_context import ID_GENERATORS, generate_uuid
+from adjutant.context.database_migrations import (
+    VERSION_1,
+    VERSION_2,
+    VERSION_3,
+    VERSION_3_TRIGGERS,
+    VERSION_4,
+    VERSION_4_TRIGGERS,
+)
+
+BATCH_SIZE = 1000
+
+
+def run(generator: str, rows: int, path: str) -> dict:
+    """Insert the rows in batches, returning throughput and file size"""
+    database = sqlite3.connect(path)
+    database.execute("PRAGMA cache_size = -2000")  # Keep the B-tree on disk
+    database.executescript(
+        ";".join(
+            [VERSION_1, VERSION_2, VERSION_3]
+            + VERSION_3_TRIGGERS
+            + [VERSION_4]
+            + VERSION_4_TRIGGERS
+        )
+    )
+
+    timings = []
+    for _ in range(rows // BATCH_SIZE):
+        ids = [(generate_uuid(generator),) for _ in range(BATCH_SIZE)]
+        start = time.perf_counter()
+        with database:
+            database.executemany("INSERT INTO bases (id) VALUES (?)", ids)
+            database.executemany(
+                "INSERT INTO bases_tags (id, bases_id, tags_id) VALUES (?, ?, '')",
+                [(generate_uuid(generator), x[0]) for x in ids],
+            )
+        timings.append(time.perf_counter() - start)
+    database.close()
+
+    tail = timings[-max(1, len(timings) // 10) :]
+    return {
+        "total": rows / sum(timings),
+        "last 10%": len(tail) * BATCH_SIZE / sum(tail),
+        "size": os.path.getsize(path),
+    }
+
+
+def main():
+    """Run the benchmark for every ID generator"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"{'generator':<14}{'rows/s':>12}{'last 10%':>12}{'size (MB)':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for generator in ID_GENERATORS:
+            path = os.path.join(directory, f"{generator}.db")
+            result = run(generator, args.rows, path)
+            print(
+                f"{generator:<14}{result['total']:>12.0f}"
+                + f"{result['last 10%']:>12.0f}{result['size'] / 2**20:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -90,6 +90,7 @@ class Models:
         assert model.insertRecord(-1, record)
         model.submitAll()
         assert model.lastError().text() == ""
+        self.context.models.bases_model.update_tag_cache()
         return uuid
 
     def add_scheme(self, name: str):
@@ -1 +1,94 @@
 """ Testing the Bases Model and its quirks"""
+
+from adjutant.context.context import Context
+from adjutant.models.sort_filter_model import SortFilterModel
+from tests.conftest import BasesRecord, Models
+
+
+def test_paged_model_fetches_rows_on_demand(context: Context):
+    """Above the threshold, rows are only fetched once they are needed"""
+    # Given
+    context.database.execute_sql_command(
+        "WITH RECURSIVE ids(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM ids "
+        + "WHERE n < 300) INSERT INTO bases (id, name) SELECT 'base' || n, '' FROM ids;"
+    )
+    model = context.models.bases_model
+    model.paged_threshold = 100
+    last_id = "base300"
+
+    # When
+    model.select()
+
+    # Then
+    assert model.paged
+    assert model.snapshot is None
+    assert model.rowCount() < 300
+    assert len(model.id_row_map) == 300
+    assert model.record_by_id(last_id).value("id") == last_id
+    assert model.rowCount() == 300
+
+
+def test_paged_model_still_filters(context: Context, models: Models):
+    """Column filters on a paged model are evaluated by the database"""
+    # Given
+    models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="bar"))
+    model = context.models.bases_model
+    model.paged_threshold = 1
+    model.select()
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(model)
+
+    # When
+    filter_model.set_column_filter(1, ["foo"])
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 1).data() == "foo"
+
+
+def test_paged_model_refilters_after_apply_field(context: Context, models: Models):
+    """Applying a field on a paged model re-evaluates the database filters"""
+    # Given
+    foo_id = models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="bar"))
+    model = context.models.bases_model
+    model.paged_threshold = 1
+    model.select()
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(model)
+    filter_model.set_column_filter(1, ["baz"])
+    filter_model.evaluate_filters()
+    filter_model.invalidateFilter()
+    assert filter_model.rowCount() == 0
+
+    # When
+    model.apply_field(1, "baz", [foo_id])
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 0).data() == foo_id
+
+
+def test_paged_model_refilters_after_set_tags(context: Context, models: Models):
+    """Setting tags on a paged model re-evaluates the database filters"""
+    # Given
+    tag_id = models.add_tag("Tag")
+    foo_id = models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="bar"))
+    model = context.models.bases_model
+    model.paged_threshold = 1
+    model.select()
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(model)
+    filter_model.set_column_filter(model.columnCount() - 1, [tag_id])
+    filter_model.evaluate_filters()
+    filter_model.invalidateFilter()
+    assert filter_model.rowCount() == 0
+
+    # When
+    context.controller.set_tags(model.index_by_id(foo_id, "id"), [tag_id])
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 0).data() == foo_id
@@ -0,0 +1,116 @@
+""" Tests for the ColumnSnapshot """
+
+from adjutant.context.context import Context
+from adjutant.context.dataclasses import Tag, ValueRange
+from adjutant.models.column_snapshot import ColumnSnapshot, display_text, rows_to_mask
+from adjutant.models.tag_index import TagIndex
+from tests.conftest import BasesRecord, Models
+
+
+def test_rows_to_mask_sets_one_byte_per_row():
+    """Each row maps onto its own byte of the mask"""
+    # Given
+    rows = [0, 2]
+
+    # When
+    mask = rows_to_mask(rows, 3)
+
+    # Then
+    assert mask.to_bytes(3, "little") == b"\x01\x00\x01"
+
+
+def test_display_text_strips_whole_floats():
+    """Whole floats are displayed without a trailing .0"""
+    assert display_text(3.0) == "3"
+    assert display_text(2.5) == "2.5"
+    assert display_text(None) == ""
+
+
+def test_snapshot_encodes_distinct_values(context: Context, models: Models):
+    """Rows holding the same value share one entry in the column"""
+    # Given
+    models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="bar"))
+    model = context.models.bases_model
+
+    # When
+    snapshot = ColumnSnapshot.from_model(model, model.record().count())
+
+    # Then
+    assert snapshot.row_count == model.rowCount()
+    assert len(snapshot.columns[1]["foo"]) == 2
+    assert snapshot.column_mask(1, ["foo", "bar"]) == snapshot.all_rows & ~(
+        snapshot.value_mask(0, "")
+    )
+
+
+def test_snapshot_tags_can_be_updated_per_row(context: Context, models: Models):
+    """Replacing a row's tags moves it between the tag postings"""
+    # Given
+    base = models.add_base(BasesRecord(name="foo"))
+    model = context.models.bases_model
+    tag_index = TagIndex()
+    snapshot = ColumnSnapshot.from_model(model, model.record().count(), tag_index)
+    row = model.id_row_map[base]
+    tag = Tag("tag", "Tag")
+
+    # When
+    tag_index.set_tags(base, [tag])
+    snapshot.update_tags(row, (), (tag,))
+
+    # Then
+    assert snapshot.accepted_rows(snapshot.tag_mask("tag"))[row] == 1
+    assert (
+        snapshot.accepted_rows(snapshot.column_mask(snapshot.tag_column, []))[row] == 0
+    )
+    matches = snapshot.text_matches("tag", snapshot.tag_column)
+    assert snapshot.matches_mask(matches) == snapshot.tag_mask("tag")
+    assert "" not in snapshot.display[snapshot.tag_column]
+
+
+def test_range_mask_follows_row_changes(context: Context, models: Models):
+    """Range masks are rebuilt once a row's value moves in or out of the range"""
+    # Given
+    for width in [10, 20, 30]:
+        models.add_base(BasesRecord(width=width))
+    model = context.models.bases_model
+    column = model.fieldIndex("width")
+    snapshot = ColumnSnapshot.from_model(model, model.record().count())
+    value_range = ValueRange(15, 30)
+    assert snapshot.range_mask(column, value_range) == rows_to_mask(
+        [1, 2], snapshot.row_count
+    )
+
+    # When
+    model.setData(model.index(0, column), 25)
+    snapshot.update_row(model, 0)
+
+    # Then
+    assert snapshot.range_mask(column, value_range) == rows_to_mask(
+        [0, 1, 2], snapshot.row_count
+    )
+
+
+def test_model_snapshot_matches_the_records(context: Context, models: Models):
+    """Reading the rows in one query gives the same values as the records"""
+    # Given
+    status_id = models.add_status("Done")
+    tag_id = models.add_tag("Tag")
+    base_id = models.add_base(
+        BasesRecord(name="foo", width=25.5, status=status_id, completed="2022-01-01")
+    )
+    models.add_base(BasesRecord(name="bar", scale="28mm"))
+    models.add_tag_use(base_id, tag_id)
+    model = context.models.bases_model
+    model.select()
+
+    # When
+    snapshot = model.current_snapshot()
+
+    # Then
+    expected = ColumnSnapshot.from_model(model, model.record().count(), model.tag_index)
+    assert snapshot.columns == expected.columns
+    assert snapshot.values == expected.values
+    assert snapshot.display == expected.display
+    assert snapshot.folded == expected.folded
@@ -7,8 +7,10 @@ from PyQt6.QtWidgets import QApplication, QInputDialog, QMessageBox
 
 from tests.conftest import Models, BasesRecord
 
-from adjutant.context.dataclasses import SchemeComponent
+from adjutant.context.database_context import get_ids_where_in, get_tags_for_base
+from adjutant.context.dataclasses import SchemeComponent, Tag
 from adjutant.context.context import Context
+import adjutant.context.controller
 
 
 def test_convert_index_tags_model(context: Context, models: Models):
@@ -84,6 +86,45 @@ def test_delete_removes_selected_indexes(context: Context, models: Models):
         assert context.models.bases_model.index(row, 0).data() != id2
 
 
+def test_delete_removes_rows_without_reset(context: Context, models: Models):
+    """Deleting records removes just their rows, without resetting the model"""
+    # Given
+    models.add_empty_bases(5)
+    model = context.models.bases_model
+    ids = [model.index(row, 0).data() for row in range(model.rowCount())]
+    resets, removed = [], []
+    model.modelReset.connect(lambda: resets.append(True))
+    model.rowsRemoved.connect(lambda _, first, last: removed.append((first, last)))
+
+    # When
+    context.controller.delete_records(
+        model, [model.index(1, 0), model.index(2, 0), model.index(4, 0)]
+    )
+
+    # Then
+    assert resets == []
+    assert removed == [(4, 4), (1, 2)]
+    assert model.id_row_map == {ids[0]: 0, ids[3]: 1}
+
+
+def test_delete_removes_tag_uses(context: Context, models: Models):
+    """Deleting bases also deletes their tag uses"""
+    # Given
+    tag_id = models.add_tag("Foo")
+    foo_id = models.add_base(BasesRecord())
+    bar_id = models.add_base(BasesRecord())
+    models.add_tag_use(foo_id, tag_id)
+    models.add_tag_use(bar_id, tag_id)
+    index = context.models.bases_model.index_by_id(foo_id, "id")
+
+    # When
+    context.controller.delete_records(context.models.bases_model, [index])
+
+    # Then
+    assert context.models.base_tags_model.rowCount() == 1
+    assert context.models.bases_model.tag_index.bases_for_tag(tag_id) == {bar_id}
+
+
 def test_delete_does_nothing_for_no_indexes(context: Context, models: Models):
     """Check that delete removes the requested indexes"""
     # Given
@@ -304,21 +345,70 @@ def test_duplicate_bases_zero_does_nothing(context: Context, models: Models):
     assert model.rowCount() == 1
 
 
-def test_duplicate_bases_returns_false_when_submit_all_fails(
+def test_duplicate_bases_returns_false_when_copy_fails(
+    context: Context, models: Models, monkeypatch
+):
+    """When duplicating a failure to copy the rows returns False"""
+    # Given
+    model = context.models.bases_model
+    models.add_base(BasesRecord(None, name="Foo Name", figures=5))
+    index = model.index(0, 0)
+    monkeypatch.setattr(adjutant.context.controller, "copy_rows", lambda *args: False)
+
+    # When
+    success = context.controller.duplicate_base(index, 2)
+
+    # Then
+    assert success is False
+
+
+def test_duplicate_bases_rolls_back_when_tags_fail(
     context: Context, models: Models, monkeypatch
 ):
-    """When duplicating a submit failure returns False"""
+    """When duplicating the tags fails, no copies are left behind"""
     # Given
     model = context.models.bases_model
     models.add_base(BasesRecord(None, name="Foo Name", figures=5))
     index = model.index(0, 0)
-    monkeypatch.setattr(model, "submitAll", lambda: False)
+    monkeypatch.setattr(context.controller, "duplicate_tags", lambda *args: False)
 
     # When
     success = context.controller.duplicate_base(index, 2)
 
     # Then
     assert success is False
+    assert model.rowCount() == 1
+    assert model.isDirty() is False
+
+
+def test_duplicate_bases_copies_tags(context: Context, models: Models):
+    """Copies of several bases are made in one go, with their tags"""
+    # Given
+    foo_tag = models.add_tag("Foo")
+    bar_tag = models.add_tag("Bar")
+    foo_id = models.add_base(BasesRecord(name="Foo"))
+    bar_id = models.add_base(BasesRecord(name="Bar"))
+    models.add_tag_use(foo_id, foo_tag)
+    models.add_tag_use(foo_id, bar_tag)
+
+    # When
+    new_ids = context.controller.duplicate_bases([foo_id, bar_id], 3)
+
+    # Then
+    model = context.models.bases_model
+    assert len(new_ids) == 6
+    assert model.rowCount() == 8
+    assert [model.record_by_id(x).value("name") for x in new_ids] == [
+        "Foo",
+        "Foo",
+        "Foo",
+        "Bar",
+        "Bar",
+        "Bar",
+    ]
+    assert model.cached_tags(new_ids[0]) == (Tag(foo_tag, "Foo"), Tag(bar_tag, "Bar"))
+    assert model.cached_tags(new_ids[3]) == ()
+    assert len(model.tag_index.bases_for_tag(foo_tag)) == 4
 
 
 def test_apply_field_updates_bases(context: Context, models: Models):
@@ -347,6 +437,53 @@ def test_apply_field_updates_bases(context: Context, models: Models):
     ).data() != source.siblingAtColumn(figures_field)
 
 
+def test_apply_tags_to_bases(context: Context, models: Models):
+    """Applying the tags column gives every selected base the same tags"""
+    # Given
+    foo_tag = models.add_tag("Foo")
+    bar_tag = models.add_tag("Bar")
+    source_id = models.add_base(BasesRecord(name="Source"))
+    kept_id = models.add_base(BasesRecord(name="Kept"))
+    other_id = models.add_base(BasesRecord(name="Other"))
+    models.add_tag_use(source_id, foo_tag)
+    models.add_tag_use(kept_id, bar_tag)
+    models.add_tag_use(other_id, bar_tag)
+    model = context.models.bases_model
+    tag_column = model.columnCount() - 1
+    source = model.index_by_id(source_id, "id").siblingAtColumn(tag_column)
+
+    # When
+    context.controller.apply_field_to_bases(source, [model.index_by_id(kept_id, "id")])
+
+    # Then
+    assert model.cached_tags(kept_id) == (Tag(foo_tag, "Foo"),)
+    assert model.cached_tags(other_id) == (Tag(bar_tag, "Bar"),)
+    assert model.tag_index.bases_for_tag(foo_tag) == {source_id, kept_id}
+    assert model.tag_index.bases_for_tag(bar_tag) == {other_id}
+
+
+def test_apply_tags_keeps_order_of_kept_tags(context: Context, models: Models):
+    """Each base caches its kept tags first, as they are stored"""
+    # Given
+    foo_tag = models.add_tag("Foo")
+    bar_tag = models.add_tag("Bar")
+    baz_tag = models.add_tag("Baz")
+    base_id = models.add_base(BasesRecord(name="Base"))
+    models.add_tag_use(base_id, foo_tag)
+    models.add_tag_use(base_id, bar_tag)
+    model = context.models.bases_model
+    tag_column = model.columnCount() - 1
+
+    # When
+    model.apply_field(tag_column, [Tag(baz_tag, "Baz"), Tag(bar_tag, "Bar")], [base_id])
+
+    # Then
+    assert model.cached_tags(base_id) == (Tag(bar_tag, "Bar"), Tag(baz_tag, "Baz"))
+    assert get_tags_for_base(context.database, base_id) == list(
+        model.cached_tags(base_id)
+    )
+
+
 ######################
 # Tags
 ######################
@@ -535,6 +672,65 @@ def test_delete_status_reassigns_bases(context: Context, monkeypatch, models: Mo
     assert base_index.data(Qt.ItemDataRole.EditRole) == ""
 
 
+def test_delete_status_cancelled_keeps_bases(context: Context, models: Models):
+    """Bases keep their status when the deletion is not confirmed"""
+    # Given
+    context.controller.confirm_deletion = mock.Mock(return_value=False)
+    status_id = models.add_status("Foo")
+    base_id = models.add_base(BasesRecord(status=status_id))
+
+    # When
+    context.controller.delete_status(context.models.statuses_model.index(1, 1))
+
+    # Then
+    record = context.models.bases_model.record_by_id(base_id)
+    assert record.value("status_id") == status_id
+
+
+def test_reassign_references_moves_bases(context: Context, models: Models):
+    """Bases in the old storage locations are moved to the new one"""
+    # Given
+    old_id = models.add_storage("Old")
+    new_id = models.add_storage("New")
+    foo_id = models.add_base(BasesRecord(storage=old_id))
+    bar_id = models.add_base(BasesRecord(storage=""))
+
+    # When
+    success = context.controller.reassign_references("storages", [old_id], new_id)
+
+    # Then
+    model = context.models.bases_model
+    assert success
+    assert model.record_by_id(foo_id).value("storages_id") == new_id
+    assert model.record_by_id(bar_id).value("storages_id") == ""
+    assert model.index_by_id(foo_id, "storages_id").data() == "New"
+
+
+##############################
+# Operations
+##############################
+def test_delete_operation_removes_steps(context: Context, models: Models, monkeypatch):
+    """Deleting an operation deletes the recipe steps using it"""
+    # Given
+    monkeypatch.setattr(
+        QMessageBox, "warning", lambda *args: QMessageBox.StandardButton.Ok
+    )
+    context.database.execute_sql_command(
+        "INSERT INTO step_operations (id, name) VALUES ('1', 'Drybrush');"
+    )
+    model = context.models.step_operations_model
+    model.select()
+    models.add_step(1, "Foo", 0)
+    models.add_step(1, "Foo", 1)
+
+    # When
+    context.controller.delete_operation(model.index_by_id("1", "name"))
+
+    # Then
+    assert context.models.recipe_steps_model.rowCount() == 0
+    assert model.id_row_map.get("1") is None
+
+
 ##############################
 # Paints
 ##############################
@@ -693,3 +889,77 @@ def test_replace_scheme_components_removes_old(context: Context, models: Models)
 
     # Then
     assert context.models.scheme_components_model.rowCount() == 0
+
+
+def test_add_tags_updates_tag_cache(context: Context, models: Models):
+    """Adding tags appends them to the cached tags for the base"""
+    # Given
+    base_id = models.add_base(BasesRecord())
+    foo_id = models.add_tag("Foo")
+    bar_id = models.add_tag("Bar")
+    index = context.models.bases_model.index(0, 0)
+    context.controller.add_tags(index, [foo_id])
+
+    # When
+    context.controller.add_tags(index, [bar_id])
+
+    # Then
+    assert context.models.bases_model.cached_tags(base_id) == (
+        Tag(foo_id, "Foo"),
+        Tag(bar_id, "Bar"),
+    )
+
+
+def test_add_tags_ignores_repeated_tags(context: Context, models: Models):
+    """A tag given more than once is only added once"""
+    # Given
+    base_id = models.add_base(BasesRecord())
+    foo_id = models.add_tag("Foo")
+    index = context.models.bases_model.index(0, 0)
+
+    # When
+    success = context.controller.add_tags(index, [foo_id, foo_id])
+
+    # Then
+    assert success
+    assert context.models.bases_model.cached_tags(base_id) == (Tag(foo_id, "Foo"),)
+    assert get_tags_for_base(context.database, base_id) == [Tag(foo_id, "Foo")]
+
+
+def test_set_tags_replaces_tag_cache(context: Context, models: Models):
+    """Setting tags replaces the cached tags for the base"""
+    # Given
+    base_id = models.add_base(BasesRecord())
+    foo_id = models.add_tag("Foo")
+    bar_id = models.add_tag("Bar")
+    models.add_tag_use(base_id, foo_id)
+    index = context.models.bases_model.index(0, 0)
+
+    # When
+    context.controller.set_tags(index, [bar_id])
+
+    # Then
+    assert context.models.bases_model.cached_tags(base_id) == (Tag(bar_id, "Bar"),)
+
+
+def test_set_tags_keeps_unchanged_uses(context: Context, models: Models):
+    """Tag uses that stay are not deleted and inserted again"""
+    # Given
+    base_id = models.add_base(BasesRecord())
+    foo_id = models.add_tag("Foo")
+    bar_id = models.add_tag("Bar")
+    use_id = models.add_tag_use(base_id, foo_id)
+    index = context.models.bases_model.index(0, 0)
+
+    # When
+    success = context.controller.set_tags(index, [bar_id, foo_id])
+
+    # Then
+    assert success
+    assert get_ids_where_in(context.database, "bases_tags", "tags_id", [foo_id]) == [
+        use_id
+    ]
+    assert context.models.bases_model.cached_tags(base_id) == (
+        Tag(foo_id, "Foo"),
+        Tag(bar_id, "Bar"),
+    )
@@ -1,26 +1,47 @@
 """ Tests for the database context"""
 
+from pathlib import Path
+import uuid
 from unittest.mock import MagicMock
 import pytest
+import yaml
 from pytest import MonkeyPatch
 from tests.conftest import (
     BasesRecord,
     Models,
 )
 from adjutant.context import Context
+from adjutant.context.dataclasses import Tag
 from adjutant.context.database_context import (
     DatabaseContext,
+    QueryBinding,
+    StatementCache,
     add_tag_to_base,
+    count_per_month,
+    delete_where_in,
     generate_uuid,
+    get_ids_where_in,
     get_tag_count,
+    get_tags_for_base,
+    range_clause,
     remove_scheme_components,
+    set_tags_for_bases,
+    update_where_in,
 )
 from adjutant.context.exceptions import (
     DatabaseIsNewer,
     DatabaseNeedsMigration,
     NoDatabaseFileFound,
+    TransactionFailed,
 )
+import adjutant.context.database_context
 import adjutant.context.database_migrations
+from adjutant.context.database_migrations import (
+    LATEST_DATABASE_VERSION,
+    VERSION_1,
+    VERSION_2,
+    VERSION_3,
+)
 
 
 def test_uuid_generates_random():
@@ -35,6 +56,31 @@ def test_uuid_generates_random():
     assert id1 != id2
 
 
+def test_uuid_is_time_ordered():
+    """IDs generated later sort after earlier ones"""
+    # Given
+
+    # When
+    ids = [generate_uuid() for _ in range(1000)]
+
+    # Then
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert uuid.UUID(ids[0]).version == 7
+
+
+def test_uuid_random_generator_keeps_version_4():
+    """The random generator still produces the IDs of existing rows"""
+    # Given
+
+    # When
+    id1 = generate_uuid("random")
+
+    # Then
+    assert len(id1) == 36
+    assert uuid.UUID(id1).version == 4
+
+
 def test_version_returns_zero_for_empty_file():
     """When there is no database, the version() function should return 0"""
     # Given
@@ -160,6 +206,21 @@ def test_add_tag_to_base(
     assert context.models.base_tags_model.rowCount() == 1
 
 
+def test_add_tag_to_base_before_base_is_added(context: Context, models: Models):
+    """A tag use added ahead of its base is resolved once the base exists"""
+    # Given
+    tag_id = models.add_tag("Foo")
+
+    # When
+    add_tag_to_base(context.database, "new", tag_id)
+    context.database.execute_sql_command(
+        "INSERT INTO bases (id, name) VALUES ('new', '');"
+    )
+
+    # Then
+    assert get_tags_for_base(context.database, "new") == [Tag(tag_id, "Foo")]
+
+
 def test_add_tag_to_base_invalid_id(
     context: Context,
     models: Models,
@@ -195,3 +256,417 @@ def test_scheme_components_remove(context: Context, models: Models):
     assert success
     context.models.scheme_components_model.select()
     assert context.models.scheme_components_model.rowCount() == 1
+
+
+def test_delete_where_in_spans_chunks(
+    context: Context, models: Models, monkeypatch: MonkeyPatch
+):
+    """Values are deleted in chunks of bound IN lists"""
+    # Given
+    monkeypatch.setattr(adjutant.context.database_context, "IN_CHUNK_SIZE", 2)
+    ids = [models.add_base(BasesRecord()) for _ in range(5)]
+
+    # When
+    found = get_ids_where_in(context.database, "bases", "id", ids[:4])
+    success = delete_where_in(context.database, "bases", "id", ids[:4])
+
+    # Then
+    assert success
+    assert sorted(found) == sorted(ids[:4])
+    assert get_ids_where_in(context.database, "bases", "id", ids) == ids[4:]
+
+
+def test_set_tags_for_bases_keeps_wanted_uses(context: Context, models: Models):
+    """Only the differences to the wanted tags are deleted and inserted"""
+    # Given
+    foo_tag = models.add_tag("Foo")
+    bar_tag = models.add_tag("Bar")
+    base_id = models.add_base(BasesRecord())
+    use_id = models.add_tag_use(base_id, bar_tag)
+
+    # When
+    success = set_tags_for_bases(context.database, [base_id], [foo_tag, bar_tag])
+
+    # Then
+    assert success
+    assert get_tags_for_base(context.database, base_id) == [
+        Tag(bar_tag, "Bar"),
+        Tag(foo_tag, "Foo"),
+    ]
+    assert get_ids_where_in(context.database, "bases_tags", "tags_id", [bar_tag]) == [
+        use_id
+    ]
+
+
+def test_set_tags_for_bases_before_base_is_added(context: Context, models: Models):
+    """Tags set for a base that is not submitted yet are kept for it"""
+    # Given
+    foo_tag = models.add_tag("Foo")
+    bar_tag = models.add_tag("Bar")
+    set_tags_for_bases(context.database, ["new"], [foo_tag, bar_tag])
+
+    # When
+    success = set_tags_for_bases(context.database, ["new"], [bar_tag])
+    context.database.execute_sql_command(
+        "INSERT INTO bases (id, name) VALUES ('new', '');"
+    )
+
+    # Then
+    assert success
+    assert get_tags_for_base(context.database, "new") == [Tag(bar_tag, "Bar")]
+
+
+def test_statement_cache_reuses_prepared_query(context: Context):
+    """Executing the same command twice re-uses the prepared query"""
+    # Given
+    statements = context.database.statements
+    command = "SELECT count(*) cnt FROM bases_tags WHERE tags_id = :tag_id;"
+    hits, misses = statements.hits, statements.misses
+
+    # When
+    first = statements.get(command)
+    second = statements.get(command)
+
+    # Then
+    assert first is second
+    assert statements.misses == misses + 1
+    assert statements.hits == hits + 1
+
+
+def test_statement_cache_evicts_least_recently_used(context: Context):
+    """When the cache is full, the least recently used query is dropped"""
+    # Given
+    statements = StatementCache(context.database.database, size=2)
+    statements.get("SELECT 1")
+    statements.get("SELECT 2")
+    statements.get("SELECT 1")
+
+    # When
+    statements.get("SELECT 3")
+
+    # Then
+    assert list(statements.statements.keys()) == ["SELECT 1", "SELECT 3"]
+
+
+def test_tag_count_uses_statement_cache(context: Context, models: Models):
+    """Repeated helper calls are served from the statement cache"""
+    # Given
+    tag_id = models.add_tag("Foo")
+    get_tag_count(context.database, tag_id)
+    hits = context.database.statements.hits
+
+    # When
+    count = get_tag_count(context.database, tag_id)
+
+    # Then
+    assert count == 0
+    assert context.database.statements.hits == hits + 1
+
+
+def test_transaction_commits_on_success(context: Context, models: Models):
+    """Changes made inside a transaction are kept when the block completes"""
+    # Given
+    base_id = models.add_base(BasesRecord())
+    tag_id = models.add_tag("Foo")
+
+    # When
+    with context.database.transaction():
+        add_tag_to_base(context.database, base_id, tag_id)
+
+    # Then
+    assert get_tag_count(context.database, tag_id) == 1
+
+
+def test_transaction_rolls_back_on_failure(context: Context, models: Models):
+    """Changes made inside a transaction are discarded when the block raises"""
+    # Given
+    base_id = models.add_base(BasesRecord())
+    tag_id = models.add_tag("Foo")
+
+    # When
+    with pytest.raises(TransactionFailed):
+        with context.database.transaction():
+            add_tag_to_base(context.database, base_id, tag_id)
+            raise TransactionFailed()
+
+    # Then
+    assert get_tag_count(context.database, tag_id) == 0
+
+
+def test_nested_transaction_only_rolls_back_inner(context: Context, models: Models):
+    """A failing nested transaction rolls back to its savepoint only"""
+    # Given
+    base_id = models.add_base(BasesRecord())
+    foo_id = models.add_tag("Foo")
+    bar_id = models.add_tag("Bar")
+
+    # When
+    with context.database.transaction():
+        add_tag_to_base(context.database, base_id, foo_id)
+        with pytest.raises(TransactionFailed):
+            with context.database.transaction():
+                add_tag_to_base(context.database, base_id, bar_id)
+                raise TransactionFailed()
+
+    # Then
+    assert get_tag_count(context.database, foo_id) == 1
+    assert get_tag_count(context.database, bar_id) == 0
+
+
+def recreate_database(context: Context, version: int, *migrations: str):
+    """Replace the database with one built by the given migrations"""
+    database = context.database
+    result = database.execute_sql_command(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        + "AND name NOT LIKE 'sqlite_%';"
+    )
+    tables = []
+    while result.next():
+        tables.append(result.value("name"))
+    database.statements.clear()
+    for table in tables:
+        database.execute_sql_command(f"DROP TABLE {table};")
+    for migration in migrations:
+        database.execute_sql_string(migration)
+    database.execute_sql_command(f"INSERT INTO settings(version) VALUES({version});")
+
+
+def test_migration_to_version_2_adds_indexes(context: Context):
+    """Migrating from version 1 removes duplicate tag uses and adds indexes"""
+    # Given
+    recreate_database(context, 1, VERSION_1)
+    context.database.execute_sql_string(
+        """
+        INSERT INTO bases (id) VALUES ('base');
+        INSERT INTO tags (id, name) VALUES ('tag', 'Foo');
+        INSERT INTO bases_tags VALUES ('first', 'base', 'tag');
+        INSERT INTO bases_tags VALUES ('second', 'base', 'tag');
+        """
+    )
+
+    # When
+    context.database.migrate()
+
+    # Then
+    assert context.database.version() == LATEST_DATABASE_VERSION
+    assert get_tag_count(context.database, "tag") == 1
+    result = context.database.execute_sql_command(
+        "SELECT count(*) cnt FROM sqlite_master WHERE type = 'index' "
+        + "AND name LIKE 'idx_%';"
+    )
+    result.next()
+    assert result.value("cnt") == 15
+
+
+def test_migration_to_version_3_adds_integer_keys(context: Context):
+    """Migrating from version 2 keys tag uses by integers and moves saved filters"""
+    # Given
+    recreate_database(context, 2, VERSION_1, VERSION_2)
+    context.database.execute_sql_string(
+        """
+        INSERT INTO bases (id) VALUES ('first');
+        INSERT INTO bases (id) VALUES ('second');
+        INSERT INTO tags (id, name) VALUES ('tag', 'Foo');
+        INSERT INTO bases_tags VALUES ('use', 'second', 'tag');
+        """
+    )
+    encoded = yaml.dump({"regex": "", "column_filters": {3: ["Round"], 22: ["tag"]}})
+    context.database.execute_sql_command(
+        "INSERT INTO searches VALUES ('search', 'Tagged', :encoded);",
+        [QueryBinding(":encoded", encoded)],
+    )
+
+    # When
+    context.database.migrate()
+
+    # Then
+    assert context.database.version() == LATEST_DATABASE_VERSION
+    assert get_tags_for_base(context.database, "second") == [Tag("tag", "Foo")]
+    result = context.database.execute_sql_command(
+        "SELECT bases_key, tags_key FROM bases_tags;"
+    )
+    result.next()
+    assert (result.value("bases_key"), result.value("tags_key")) == (2, 1)
+    result = context.database.execute_sql_command("SELECT encoded FROM searches;")
+    result.next()
+    filters = yaml.safe_load(result.value("encoded"))
+    assert filters["column_filters"] == {3: ["Round"], 23: ["tag"]}
+
+
+def test_tag_uses_added_before_their_tag_are_resolved(context: Context, models: Models):
+    """Tag uses imported ahead of their tag get its key once it is added"""
+    # Given
+    base_id = models.add_base(BasesRecord())
+    context.database.execute_sql_command(
+        "INSERT INTO bases_tags (id, bases_id, tags_id) VALUES ('use', :base, 'tag');",
+        [QueryBinding(":base", base_id)],
+    )
+
+    # When
+    models.add_tag("Foo", "tag")
+
+    # Then
+    assert get_tags_for_base(context.database, base_id) == [Tag("tag", "Foo")]
+
+
+def test_migration_to_version_4_normalises_dates(context: Context):
+    """Migrating from version 3 stores dates as ISO-8601 and unknown ones as NULL"""
+    # Given
+    recreate_database(context, 3, VERSION_1, VERSION_2, VERSION_3)
+    context.database.execute_sql_string(
+        """
+        INSERT INTO bases (id, date_added, date_acquired, date_completed)
+        VALUES ('base', '2006-03-15', 0, '2006-04-07 10:30:00');
+        INSERT INTO bases (id, date_added, date_acquired, date_completed)
+        VALUES ('other', '', 'spring', NULL)
+        """
+    )
+
+    # When
+    context.database.migrate()
+
+    # Then
+    assert context.database.version() == LATEST_DATABASE_VERSION
+    result = context.database.execute_sql_command(
+        "SELECT ifnull(date_added, 'NULL'), ifnull(date_acquired, 'NULL'), "
+        + "ifnull(date_completed, 'NULL') FROM bases ORDER BY key;"
+    )
+    rows = []
+    while result.next():
+        rows.append(tuple(result.value(x) for x in range(3)))
+    assert rows == [("2006-03-15", "NULL", "2006-04-07"), ("NULL", "spring", "NULL")]
+
+
+def test_unknown_dates_are_stored_as_null(context: Context, models: Models):
+    """Empty dates written to a base are stored as NULL"""
+    # Given
+    base_id = models.add_base(BasesRecord(completed="2022-01-01"))
+
+    # When
+    update_where_in(context.database, "bases", "date_completed", "", "id", [base_id])
+
+    # Then
+    result = context.database.execute_sql_command(
+        "SELECT count(*) cnt FROM bases WHERE date_completed IS NULL;"
+    )
+    result.next()
+    assert result.value("cnt") == 1
+
+
+def test_range_clause_leaves_missing_bounds_open():
+    """A range without a bound only excludes unknown values on that side"""
+    # Given
+
+    # When
+    both = range_clause("price", 1, 2.5)
+    after = range_clause("date_added", "2022-01-01")
+    neither = range_clause("width")
+
+    # Then
+    assert (
+        both == "typeof(price) IN ('integer', 'real') AND price >= 1 AND price <= 2.5"
+    )
+    assert after == "date_added >= '2022-01-01'"
+    assert neither == "width IS NOT NULL"
+
+
+def test_range_clause_skips_text_in_numeric_ranges(context: Context, models: Models):
+    """Text values sort above numbers, but are outside any numeric range"""
+    # Given
+    models.add_base(BasesRecord(name="wide", width=50))
+    models.add_base(BasesRecord(name="unknown", width=""))
+
+    # When
+    result = context.database.execute_sql_command(
+        f"SELECT name FROM bases WHERE {range_clause('width', 25)};"
+    )
+
+    # Then
+    names = []
+    while result.next():
+        names.append(result.value("name"))
+    assert names == ["wide"]
+
+
+def test_count_per_month_skips_unknown_dates(context: Context, models: Models):
+    """Only bases with a known date are counted, per year and month"""
+    # Given
+    models.add_base(BasesRecord(completed="2021-03-01"))
+    models.add_base(BasesRecord(completed="2021-03-31"))
+    models.add_base(BasesRecord(completed="2022-01-02"))
+    models.add_base(BasesRecord(completed=""))
+    models.add_base(BasesRecord())
+
+    # When
+    counts = count_per_month(context.database, "bases", "date_completed")
+
+    # Then
+    assert counts == {("2021", "03"): 2, ("2022", "01"): 1}
+
+
+def pragma_value(context: Context, pragma: str):
+    """Reads the current value of a pragma"""
+    result = context.database.execute_sql_command(f"PRAGMA {pragma};")
+    result.next()
+    value = result.value(0)
+    result.finish()
+    return value
+
+
+def test_apply_profile_fast(context: Context):
+    """The fast profile relaxes synchronous writes and keeps temp data in memory"""
+    # Given
+
+    # When
+    context.database.apply_profile("fast")
+
+    # Then
+    assert pragma_value(context, "synchronous") == 1  # NORMAL
+    assert pragma_value(context, "temp_store") == 2  # MEMORY
+
+
+def test_apply_profile_safe(context: Context):
+    """The safe profile uses fully synchronous writes"""
+    # Given
+
+    # When
+    context.database.apply_profile("safe")
+
+    # Then
+    assert pragma_value(context, "synchronous") == 2  # FULL
+    assert pragma_value(context, "temp_store") == 0  # DEFAULT
+
+
+def test_apply_profile_unknown_uses_default(context: Context):
+    """An unknown profile name falls back to the default profile"""
+    # Given
+    context.database.apply_profile("safe")
+
+    # When
+    context.database.apply_profile("Foo")
+
+    # Then
+    assert pragma_value(context, "synchronous") == 1
+
+
+def test_apply_profile_leaves_wal_mode_at_runtime(
+    context: Context, monkeypatch: MonkeyPatch, tmp_path: Path
+):
+    """Switching to the safe profile leaves WAL despite earlier SELECTs"""
+    # Given
+    monkeypatch.setattr(
+        adjutant.context.database_context, "DATABASE_FILE", tmp_path / "adjutant.db"
+    )
+    try:
+        context.database.open_database("fast")
+    except NoDatabaseFileFound:
+        context.database.migrate()
+    assert context.database.version() == LATEST_DATABASE_VERSION
+    assert pragma_value(context, "journal_mode") == "wal"
+
+    # When
+    context.database.apply_profile("safe")
+
+    # Then
+    assert pragma_value(context, "journal_mode") == "delete"
+    assert pragma_value(context, "synchronous") == 2  # FULL
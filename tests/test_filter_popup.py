@@ -4,10 +4,13 @@ from typing import List
 from pytestqt.qtbot import QtBot
 from PyQt6.QtGui import QStandardItem, QStandardItemModel
 from PyQt6.QtCore import Qt
+from adjutant.context.context import Context
+from adjutant.context.dataclasses import ValueRange
 from adjutant.windows.filter_popup import (
     FilterPopup,
     from_check_state,
     invert_check_state,
+    parse_bound,
     to_check_state,
 )
 from adjutant.models.sort_filter_model import SortFilterModel
@@ -268,3 +271,88 @@ def test_update_filter_empyt_list_when_all_checked(qtbot: QtBot):
 
     # Then
     assert popup.model.column_filters[0] is None
+
+
+def test_items_show_row_counts(qtbot: QtBot):
+    """Every item shows how many rows hold the value"""
+    # Given
+    popup = create_popup(["Foo", "Foo", "Bar"])
+    qtbot.add_widget(popup)
+
+    # When
+    popup.setup_filter()
+
+    # Then
+    assert popup.list_model.item(0, 0).text() == "Bar (1)"
+    assert popup.list_model.item(1, 0).text() == "Foo (2)"
+
+
+def test_parse_bound_ignores_invalid_text():
+    """Bounds are converted to numbers or ISO dates, None if they can't be"""
+    assert parse_bound("20", False) == 20
+    assert parse_bound("2.5", False) == 2.5
+    assert parse_bound("2022-01-02", True) == "2022-01-02"
+    assert parse_bound("", False) is None
+    assert parse_bound("soon", True) is None
+
+
+def test_parse_bound_ignores_non_finite_numbers():
+    """Infinite and NaN bounds are no bound"""
+    assert parse_bound("inf", False) is None
+    assert parse_bound("-Infinity", False) is None
+    assert parse_bound("nan", False) is None
+
+
+def test_range_edits_only_shown_for_range_columns(qtbot: QtBot, context: Context):
+    """Numeric and date columns can be filtered by a range"""
+    # Given
+    model = SortFilterModel()
+    model.setSourceModel(context.models.bases_model)
+    bases = context.models.bases_model
+
+    # When
+    name_popup = FilterPopup(None, model, bases.fieldIndex("name"))
+    date_popup = FilterPopup(None, model, bases.fieldIndex("date_completed"))
+    qtbot.add_widget(name_popup)
+    qtbot.add_widget(date_popup)
+
+    # Then
+    assert not name_popup.ranged
+    assert date_popup.ranged
+    assert date_popup.range_edits["minimum"].placeholderText() == "On or after"
+
+
+def test_update_filter_sets_entered_range(qtbot: QtBot, context: Context):
+    """A range entered in the popup replaces the list of values"""
+    # Given
+    model = SortFilterModel()
+    model.setSourceModel(context.models.bases_model)
+    column = context.models.bases_model.fieldIndex("price")
+    popup = FilterPopup(None, model, column)
+    qtbot.add_widget(popup)
+    popup.setup_filter()
+    popup.range_edits["minimum"].setText("5")
+
+    # When
+    popup.update_filters()
+
+    # Then
+    assert model.get_column_filter(column) == ValueRange(5, None)
+
+
+def test_setup_filter_shows_current_range(qtbot: QtBot, context: Context):
+    """Reopening the popup shows the range that is set"""
+    # Given
+    model = SortFilterModel()
+    model.setSourceModel(context.models.bases_model)
+    column = context.models.bases_model.fieldIndex("width")
+    model.set_column_filter(column, ValueRange(None, 25))
+    popup = FilterPopup(None, model, column)
+    qtbot.add_widget(popup)
+
+    # When
+    popup.setup_filter()
+
+    # Then
+    assert popup.range_edits["minimum"].text() == ""
+    assert popup.range_edits["maximum"].text() == "25"
@@ -33,3 +33,18 @@ def test_combobox_changing_combobox_updates_settings(qtbot: QtBot, context: Cont
 
     # Then
     assert context.settings.font_size != font_size
+
+
+def test_changing_database_profile_updates_settings(qtbot: QtBot, context: Context):
+    """Changing the database profile combobox updates settings"""
+    # Given
+    context.settings.database_profile = "fast"
+    dialog = PreferencesDialog(None, context)
+    qtbot.addWidget(dialog)
+
+    # When
+    dialog.database_profile.setCurrentIndex(dialog.database_profile.findData("safe"))
+    dialog.database_profile_changed()
+
+    # Then
+    assert context.settings.database_profile == "safe"
@@ -6,8 +6,14 @@ from tests.conftest import (
     BasesRecord,
     Models,
 )
-from adjutant.context.dataclasses import ManyToManyRelationship, Tag
-from adjutant.models.relational_model import OneToManyRelationship, RelationalModel
+from adjutant.context.database_context import get_tags_for_base
+from adjutant.context.dataclasses import ManyToManyRelationship, RowChanges, Tag
+from adjutant.models.relational_model import (
+    FETCH_ON_DEMAND,
+    OneToManyRelationship,
+    RelationalModel,
+)
+from adjutant.models.tag_index import TagIndex
 from adjutant.context.context import Context
 
 
@@ -259,14 +265,14 @@ def test_m2m_set_tags_adds_them(
     relationship = ManyToManyRelationship("tags", "name")
     relational_model.set_many_to_many_relationship(relationship)
     models.add_empty_bases(1)
-    models.add_tag("Foo")
+    foo_id = models.add_tag("Foo")
     models.add_tag("Bar")
 
     context.models.base_tags_model.select()
     assert context.models.base_tags_model.rowCount() == 0
 
     index = relational_model.index(0, relational_model.columnCount() - 1)
-    tags = [Tag(1, "")]
+    tags = [Tag(foo_id, "")]
 
     # When
     success = relational_model.setData(index, tags)
@@ -467,3 +473,391 @@ def test_index_by_id(models: Models, context: Context):
 
     # Then
     assert index.data() == "Foo"
+
+
+def test_tag_cache_loaded_on_select(
+    relational_model: RelationalModel, models: Models, context: Context
+):
+    """Selecting a model with an m2m relationship loads all tags into the cache"""
+    # Given
+    relational_model.set_many_to_many_relationship(
+        ManyToManyRelationship("tags", "name")
+    )
+    base_id = models.add_base(BasesRecord())
+    foo_id = models.add_tag("Foo")
+    models.add_tag_use(base_id, foo_id)
+    relational_model.tag_index = TagIndex()
+
+    # When
+    relational_model.select()
+
+    # Then
+    assert relational_model.cached_tags(base_id) == (Tag(foo_id, "Foo"),)
+
+
+def test_m2m_set_tags_updates_cache(relational_model: RelationalModel, models: Models):
+    """Setting tags on the m2m column updates the cache without a reload"""
+    # Given
+    relational_model.set_many_to_many_relationship(
+        ManyToManyRelationship("tags", "name")
+    )
+    base_id = models.add_base(BasesRecord())
+    foo_id = models.add_tag("Foo")
+    index = relational_model.index(0, relational_model.columnCount() - 1)
+
+    # When
+    relational_model.setData(index, [Tag(foo_id, "Foo")])
+
+    # Then
+    assert relational_model.cached_tags(base_id) == (Tag(foo_id, "Foo"),)
+    assert index.data(Qt.ItemDataRole.DisplayRole) == "Foo"
+
+
+def test_linked_relationship_resolves_from_target_model(
+    relational_model: RelationalModel, models: Models, context: Context
+):
+    """A relationship linked to a target model resolves through its lookup table"""
+    # Given
+    relational_model.set_one_to_many_relationship(
+        relational_model.fieldIndex("storages_id"),
+        OneToManyRelationship("storages", "id", "name"),
+    )
+    relational_model.set_one_to_many_model(
+        relational_model.fieldIndex("storages_id"), context.models.storages_model
+    )
+    storage_id = models.add_storage("Foo")
+    models.add_base(BasesRecord(storage=storage_id))
+
+    # When
+    value = relational_model.field_data(0, "storages_id")
+
+    # Then
+    assert value == "Foo"
+
+
+def test_linked_relationship_updates_when_target_changes(
+    relational_model: RelationalModel, models: Models, context: Context
+):
+    """When the target model is reselected, the lookup table is rebuilt"""
+    # Given
+    relational_model.set_one_to_many_relationship(
+        relational_model.fieldIndex("storages_id"),
+        OneToManyRelationship("storages", "id", "name"),
+    )
+    relational_model.set_one_to_many_model(
+        relational_model.fieldIndex("storages_id"), context.models.storages_model
+    )
+    storage_id = models.add_storage("Foo")
+    models.add_base(BasesRecord(storage=storage_id))
+    storages = context.models.storages_model
+
+    # When
+    storages.setData(storages.index_by_id(storage_id, "name"), "Bar")
+    storages.submitAll()
+
+    # Then
+    assert relational_model.field_data(0, "storages_id") == "Bar"
+
+
+def test_distinct_values_are_counted(context: Context, models: Models):
+    """Each distinct value is returned once, with the number of rows"""
+    # Given
+    models.add_base(BasesRecord(name="Foo"))
+    models.add_base(BasesRecord(name="Foo"))
+    models.add_base(BasesRecord(name="Bar"))
+    model = context.models.bases_model
+
+    # When
+    values = model.distinct_values(model.fieldIndex("name"))
+
+    # Then
+    assert sorted(values) == [("Bar", "Bar", 1), ("Foo", "Foo", 2)]
+
+
+def test_distinct_values_resolve_linked_names(context: Context, models: Models):
+    """Values of one-to-many columns are shown by their linked name"""
+    # Given
+    status_id = models.add_status("Primed")
+    models.add_base(BasesRecord(status=status_id))
+    models.add_base(BasesRecord(status=status_id))
+    model = context.models.bases_model
+
+    # When
+    values = model.distinct_values(model.fieldIndex("status_id"))
+
+    # Then
+    assert values == [(status_id, "Primed", 2)]
+
+
+def test_distinct_tags_are_counted(context: Context, models: Models):
+    """The tags column lists every tag in use with its number of bases"""
+    # Given
+    foo_id = models.add_tag("Foo")
+    base1 = models.add_base(BasesRecord())
+    base2 = models.add_base(BasesRecord())
+    models.add_tag_use(base1, foo_id)
+    models.add_tag_use(base2, foo_id)
+    model = context.models.bases_model
+
+    # When
+    values = model.distinct_values(model.column_id_tags())
+
+    # Then
+    assert values == [(foo_id, "Foo", 2)]
+
+
+def test_distinct_values_cached_until_data_updated(context: Context, models: Models):
+    """Distinct values are only queried again once the data is updated"""
+    # Given
+    models.add_base(BasesRecord(name="Foo"))
+    model = context.models.bases_model
+    column = model.fieldIndex("name")
+    assert len(model.distinct_values(column)) == 1
+
+    # When
+    model.db_context.execute_sql_command(
+        "INSERT INTO bases (id, name) VALUES ('bar', 'Bar');"
+    )
+    cached = model.distinct_values(column)
+    model.select()
+
+    # Then
+    assert len(cached) == 1
+    assert len(model.distinct_values(column)) == 2
+
+
+def test_renamed_tag_updates_tag_index(context: Context, models: Models):
+    """Renaming a tag updates the names held for every base"""
+    # Given
+    foo_id = models.add_tag("Foo")
+    base_id = models.add_base(BasesRecord())
+    models.add_tag_use(base_id, foo_id)
+    tags_model = context.models.tags_model
+    index = tags_model.index_by_id(foo_id, "name")
+
+    # When
+    tags_model.setData(index, "Bar")
+    tags_model.submitAll()
+
+    # Then
+    bases_model = context.models.bases_model
+    assert bases_model.cached_tags(base_id) == (Tag(foo_id, "Bar"),)
+
+
+def test_deleted_tag_removed_from_tag_index(context: Context, models: Models):
+    """Deleting a tag removes it from every base"""
+    # Given
+    foo_id = models.add_tag("Foo")
+    bar_id = models.add_tag("Bar")
+    base_id = models.add_base(BasesRecord())
+    models.add_tag_use(base_id, foo_id)
+    models.add_tag_use(base_id, bar_id)
+
+    # When
+    context.controller.delete_tag(context.models.tags_model.index_by_id(foo_id, "id"))
+
+    # Then
+    bases_model = context.models.bases_model
+    assert bases_model.cached_tags(base_id) == (Tag(bar_id, "Bar"),)
+    assert bases_model.tag_index.bases_for_tag(foo_id) == set()
+
+
+def test_eager_fetch_policy_loads_every_row(context: Context):
+    """With the eager policy, select fetches past the first chunk"""
+    # Given
+    context.database.execute_sql_command(
+        "WITH RECURSIVE ids(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM ids "
+        + "WHERE n < 300) INSERT INTO tags (id, name) SELECT 'tag' || n, '' FROM ids;"
+    )
+    model = context.models.tags_model
+
+    # When
+    model.select()
+
+    # Then
+    assert model.rowCount() == 300
+    assert model.record_by_id("tag300").value("id") == "tag300"
+
+
+def test_on_demand_fetch_policy_maps_unfetched_rows(context: Context):
+    """With the on-demand policy, IDs of unfetched rows are still mapped"""
+    # Given
+    context.database.execute_sql_command(
+        "WITH RECURSIVE ids(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM ids "
+        + "WHERE n < 300) INSERT INTO searches (id, name) SELECT 'search' || n, '' FROM ids;"
+    )
+    model = context.models.searches_model
+    model.fetch_policy = FETCH_ON_DEMAND
+
+    # When
+    model.select()
+
+    # Then
+    assert model.rowCount() < 300
+    assert model.id_row_map["search300"] == 299
+    assert model.index_by_id("search300", "id").data() == "search300"
+
+
+def test_id_row_map_patched_on_insert_and_remove(context: Context, models: Models):
+    """Pending rows are added to and removed from the ID map"""
+    # Given
+    models.add_tag("Foo", "foo")
+    model = context.models.tags_model
+    record = model.record()
+    record.setValue("id", "bar")
+    record.setValue("name", "Bar")
+
+    # When
+    model.insertRecord(-1, record)
+    inserted = dict(model.id_row_map)
+    model.removeRow(model.id_row_map["bar"])
+
+    # Then
+    assert inserted == {"foo": 0, "bar": 1}
+    assert model.id_row_map == {"foo": 0}
+
+
+def test_tags_set_on_added_base_before_submit(context: Context, models: Models):
+    """Tags edited while adding a base are saved once the base is submitted"""
+    # Given
+    tag_id = models.add_tag("Foo")
+    model = context.models.bases_model
+    record = model.record()
+    record.setValue("id", "new")
+    model.insertRecord(-1, record)
+    index = model.index_by_id("new", "id").siblingAtColumn(model.columnCount() - 1)
+
+    # When
+    model.setData(index, [Tag(tag_id, "Foo")], Qt.ItemDataRole.EditRole)
+    model.submitAll()
+
+    # Then
+    assert get_tags_for_base(context.database, "new") == [Tag(tag_id, "Foo")]
+
+
+def test_updated_rows_refreshed_without_reset(context: Context, models: Models):
+    """Updated IDs are read back row by row, without resetting the model"""
+    # Given
+    base_id = models.add_base(BasesRecord(name="Foo"))
+    model = context.models.bases_model
+    context.database.execute_sql_command(
+        f"UPDATE bases SET name = 'Bar' WHERE id = '{base_id}';"
+    )
+    resets = []
+    model.modelReset.connect(lambda: resets.append(True))
+    model.current_snapshot()
+
+    # When
+    model.apply_changes(RowChanges(updated=[base_id]))
+
+    # Then
+    column = model.fieldIndex("name")
+    assert resets == []
+    assert model.index_by_id(base_id, "name").data() == "Bar"
+    snapshot = model.snapshot
+    assert snapshot.matches_mask(snapshot.text_matches("bar", column)) == 1
+    assert snapshot.matches_mask(snapshot.text_matches("foo", column)) == 0
+
+
+def test_deleted_rows_removed_from_model(context: Context, models: Models):
+    """Deleted IDs are removed from the model"""
+    # Given
+    foo_id = models.add_base(BasesRecord(name="Foo"))
+    bar_id = models.add_base(BasesRecord(name="Bar"))
+    model = context.models.bases_model
+    context.database.execute_sql_command(f"DELETE FROM bases WHERE id = '{foo_id}';")
+
+    # When
+    model.apply_changes(RowChanges(deleted=[foo_id]))
+
+    # Then
+    assert model.rowCount() == 1
+    assert model.id_row_map == {bar_id: 0}
+
+
+def test_inserted_and_deleted_rows_applied_without_reset(
+    context: Context, models: Models
+):
+    """Rows added or removed in the database are inserted or removed in place"""
+    # Given
+    foo_id = models.add_base(BasesRecord(name="Foo"))
+    bar_id = models.add_base(BasesRecord(name="Bar"))
+    baz_id = models.add_base(BasesRecord(name="Baz"))
+    model = context.models.bases_model
+    context.database.execute_sql_command(f"DELETE FROM bases WHERE id = '{bar_id}';")
+    context.database.execute_sql_command(
+        "INSERT INTO bases (id, name) VALUES ('qux', 'Qux');"
+    )
+    resets, removed, inserted = [], [], []
+    model.modelReset.connect(lambda: resets.append(True))
+    model.rowsRemoved.connect(lambda _, first, last: removed.append((first, last)))
+    model.rowsInserted.connect(lambda _, first, last: inserted.append((first, last)))
+
+    # When
+    model.apply_changes(RowChanges(inserted=["qux"], deleted=[bar_id]))
+
+    # Then
+    assert resets == []
+    assert removed == [(1, 1)]
+    assert inserted == [(2, 2)]
+    assert model.id_row_map == {foo_id: 0, baz_id: 1, "qux": 2}
+    assert model.index_by_id("qux", "name").data() == "Qux"
+
+
+def test_tag_uses_applied_to_bases(context: Context, models: Models):
+    """Changes to tag uses refresh the tags shown on the bases"""
+    # Given
+    foo_id = models.add_tag("Foo")
+    base_id = models.add_base(BasesRecord())
+    context.database.execute_sql_command(
+        "INSERT INTO bases_tags (id, bases_id, tags_id) "
+        + f"VALUES ('use', '{base_id}', '{foo_id}');"
+    )
+
+    # When
+    context.models.apply_changes("bases_tags", RowChanges(inserted=["use"]))
+
+    # Then
+    assert context.models.bases_model.cached_tags(base_id) == (Tag(foo_id, "Foo"),)
+
+
+def test_data_version_bumped_on_changes(context: Context, models: Models):
+    """Every change made through the model moves its data version on"""
+    # Given
+    model = context.models.tags_model
+    versions = [context.models.version("tags")]
+
+    # When
+    models.add_tag("Foo", "foo")
+    versions.append(model.data_version)
+    model.setData(model.index_by_id("foo", "name"), "Bar")
+    versions.append(model.data_version)
+    model.removeRow(model.id_row_map["foo"])
+    versions.append(model.data_version)
+    model.select()
+    versions.append(model.data_version)
+
+    # Then
+    assert versions == sorted(set(versions))
+    assert context.models.changed_since("tags", versions[0])
+    assert not context.models.changed_since("tags", versions[-1])
+
+
+def test_distinct_values_follow_linked_table(context: Context, models: Models):
+    """Distinct values are queried again when the linked table changes"""
+    # Given
+    box_id = models.add_storage("Box")
+    models.add_base(BasesRecord(storage=box_id))
+    model = context.models.bases_model
+    column = model.fieldIndex("storages_id")
+    assert model.distinct_values(column) == [(box_id, "Box", 1)]
+    version = model.data_version
+
+    # When
+    storages_model = context.models.storages_model
+    storages_model.setData(storages_model.index_by_id(box_id, "name"), "Crate")
+    storages_model.submitAll()
+
+    # Then
+    assert not model.changed_since(version)
+    assert model.distinct_values(column) == [(box_id, "Crate", 1)]
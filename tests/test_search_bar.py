@@ -66,3 +66,37 @@ def test_load_search_sets_edit_text(qtbot: QtBot, context: Context):
 
     # Then
     assert search_bar.filter_edit.text() == "Foo"
+
+
+def test_typing_applies_filter_once_after_delay(qtbot: QtBot, context: Context):
+    """Keystrokes in quick succession only apply the final text"""
+    # Given
+    search_bar = SearchBar(context)
+    qtbot.addWidget(search_bar)
+    emitted = []
+    search_bar.filter_text_changed.connect(emitted.append)
+
+    # When
+    with qtbot.waitSignal(search_bar.filter_text_changed, timeout=1000):
+        search_bar.filter_edit.setText("F")
+        search_bar.filter_edit.setText("Fo")
+        search_bar.filter_edit.setText("Foo")
+
+    # Then
+    assert emitted == ["Foo"]
+
+
+def test_clear_applies_filter_immediately(qtbot: QtBot, context: Context):
+    """Clearing the filter does not wait for the timer"""
+    # Given
+    search_bar = SearchBar(context)
+    qtbot.addWidget(search_bar)
+    search_bar.filter_edit.setText("Foo")
+
+    # When
+    with qtbot.waitSignal(search_bar.filter_text_changed, timeout=10) as blocker:
+        search_bar.clear_filter()
+
+    # Then
+    assert blocker.args == [""]
+    assert not search_bar.filter_timer.isActive()
@@ -79,3 +79,20 @@ def test_save_writes_to_file(monkeypatch: MonkeyPatch, tmp_path: Path):
 
     # Then
     assert "99" in filename.read_text()
+
+
+def test_database_profile_round_trips(monkeypatch: MonkeyPatch, tmp_path: Path):
+    """The database profile is saved to and loaded from the settings file"""
+    # Given
+    settings = SettingsContext()
+    filename = tmp_path / "settings.yaml"
+    monkeypatch.setattr(adjutant.context.settings_context, "SETTINGS_FILE", filename)
+    settings.database_profile = "safe"
+    settings.save()
+
+    # When
+    loaded = SettingsContext()
+    loaded.load()
+
+    # Then
+    assert loaded.database_profile == "safe"
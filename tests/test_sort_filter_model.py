@@ -1,7 +1,12 @@
 """ Tests for the SortFilterModel """
 
 
+from PyQt6.QtCore import QPersistentModelIndex, Qt
+from PyQt6.QtGui import QStandardItem, QStandardItemModel
+from PyQt6.QtWidgets import QInputDialog
 from adjutant.context.context import Context
+from adjutant.context.dataclasses import RowChanges, ValueRange
+from adjutant.models.relational_model import RelationalModel
 from adjutant.models.sort_filter_model import SortFilterModel
 from tests.conftest import BasesRecord, Models
 
@@ -133,3 +138,373 @@ def test_zero_id_can_be_shown(context: Context):
 
     # Then
     assert filter_model.rowCount() == 1
+
+
+def test_tag_filter_requires_all_tags(context: Context, models: Models):
+    """Filtering the tags column only shows bases that have all the tags"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    foo_id = models.add_tag("Foo")
+    bar_id = models.add_tag("Bar")
+    both = models.add_base(BasesRecord(name="both"))
+    only_foo = models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="none"))
+    models.add_tag_use(both, foo_id)
+    models.add_tag_use(both, bar_id)
+    models.add_tag_use(only_foo, foo_id)
+    tags_column = context.models.bases_model.column_id_tags()
+
+    # When
+    filter_model.set_column_filter(tags_column, [foo_id, bar_id])
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 0).data() == both
+
+
+def test_empty_tag_filter_shows_untagged(context: Context, models: Models):
+    """An empty tag filter only shows bases without any tags"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    foo_id = models.add_tag("Foo")
+    tagged = models.add_base(BasesRecord(name="tagged"))
+    untagged = models.add_base(BasesRecord(name="untagged"))
+    models.add_tag_use(tagged, foo_id)
+    tags_column = context.models.bases_model.column_id_tags()
+
+    # When
+    filter_model.set_column_filter(tags_column, [])
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 0).data() == untagged
+
+
+def test_filters_reapplied_when_source_reselected(context: Context, models: Models):
+    """New matching rows are shown once the source model is reselected"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    models.add_base(BasesRecord(name="foo"))
+    filter_model.set_column_filter(1, ["foo"])
+
+    # When
+    models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="bar"))
+
+    # Then
+    assert filter_model.rowCount() == 2
+
+
+def test_filter_values_are_quoted(context: Context, models: Models):
+    """Filter values containing quotes are matched literally"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    models.add_base(BasesRecord(name="Foo's"))
+    models.add_base(BasesRecord(name="Bar"))
+
+    # When
+    filter_model.set_column_filter(1, ["Foo's"])
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 1).data() == "Foo's"
+
+
+def test_text_filter_matches_displayed_lookup(context: Context, models: Models):
+    """The free-text filter matches the displayed text of linked columns"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    status_id = models.add_status("Primed")
+    models.add_base(BasesRecord(name="foo", status=status_id))
+    models.add_base(BasesRecord(name="bar"))
+    context.models.bases_model.select()
+    filter_model.setFilterKeyColumn(-1)
+    filter_model.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+
+    # When
+    filter_model.setFilterFixedString("primed")
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 1).data() == "foo"
+
+
+def test_tag_filter_follows_tag_changes(context: Context, models: Models):
+    """Changing a base's tags updates the rows shown by a tag filter"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    foo_id = models.add_tag("Foo")
+    base = models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="bar"))
+    filter_model.set_column_filter(
+        context.models.bases_model.column_id_tags(), [foo_id]
+    )
+    assert filter_model.rowCount() == 0
+
+    # When
+    context.controller.set_tags(
+        context.models.bases_model.index_by_id(base, "id"), [foo_id]
+    )
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 0).data() == base
+
+
+def test_extended_text_filter_refines_matches(context: Context, models: Models):
+    """Extending the filter text narrows the previous matches"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    filter_model.setFilterKeyColumn(1)
+    filter_model.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+    models.add_base(BasesRecord(name="Foo"))
+    models.add_base(BasesRecord(name="Food"))
+    models.add_base(BasesRecord(name="Bar"))
+    filter_model.setFilterFixedString("fo")
+    assert filter_model.rowCount() == 2
+
+    # When
+    filter_model.setFilterFixedString("food")
+
+    # Then
+    assert filter_model.text_matches == {1: ["Food"]}
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 1).data() == "Food"
+
+
+def test_shortened_text_filter_matches_all_rows(context: Context, models: Models):
+    """Removing characters from the filter text tests all rows again"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    filter_model.setFilterKeyColumn(1)
+    filter_model.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+    models.add_base(BasesRecord(name="Foo"))
+    models.add_base(BasesRecord(name="Food"))
+    filter_model.setFilterFixedString("food")
+
+    # When
+    filter_model.setFilterFixedString("foo")
+
+    # Then
+    assert filter_model.rowCount() == 2
+
+
+def test_search_text_is_cached_per_row():
+    """The display values of a row are joined and folded once"""
+    # Given
+    source = QStandardItemModel()
+    source.appendRow([QStandardItem("1"), QStandardItem("Foo")])
+    source.appendRow([QStandardItem("2"), QStandardItem("Bar")])
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(source)
+    filter_model.setFilterKeyColumn(-1)
+    filter_model.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+
+    # When
+    filter_model.setFilterFixedString("foo")
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.search_texts == {0: "1\0foo", 1: "2\0bar"}
+
+
+def test_search_text_refreshed_when_row_changes():
+    """Changing a row's data drops only that row's cached search text"""
+    # Given
+    source = QStandardItemModel()
+    source.appendRow([QStandardItem("1"), QStandardItem("Foo")])
+    source.appendRow([QStandardItem("2"), QStandardItem("Bar")])
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(source)
+    filter_model.setFilterKeyColumn(-1)
+    filter_model.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+    filter_model.setFilterFixedString("foo")
+
+    # When
+    source.item(1, 1).setText("Food")
+
+    # Then
+    assert filter_model.rowCount() == 2
+    assert filter_model.search_texts[1] == "2\0food"
+
+
+def test_search_texts_kept_when_snapshot_is_patched(
+    context: Context, models: Models, relational_model: RelationalModel
+):
+    """Patching the snapshot leaves the cached search texts to dataChanged"""
+    # Given
+    models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="bar"))
+    relational_model.select()
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(relational_model)
+    filter_model.setFilterKeyColumn(-1)
+    filter_model.setFilterFixedString("foo")
+    assert filter_model.rowCount() == 1
+    filter_model.search_texts[1] = "cached foo"
+
+    # When
+    relational_model.snapshot_updated.emit()
+
+    # Then
+    assert filter_model.rowCount() == 2
+    assert filter_model.search_texts[1] == "cached foo"
+
+
+def test_range_filter_accepts_values_within_bounds(context: Context, models: Models):
+    """Only rows with a value between both bounds are shown"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    for width in [10, 20, 30, 40]:
+        models.add_base(BasesRecord(width=width))
+    column = context.models.bases_model.fieldIndex("width")
+
+    # When
+    filter_model.set_column_filter(column, ValueRange(20, 30))
+
+    # Then
+    widths = [filter_model.index(x, column).data() for x in range(2)]
+    assert filter_model.rowCount() == 2
+    assert sorted(widths) == [20, 30]
+
+
+def test_open_range_filter_is_evaluated_by_database(
+    context: Context, models: Models, relational_model: RelationalModel
+):
+    """A range with one bound skips rows without a value"""
+    # Given
+    relational_model.select()
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(relational_model)
+    models.add_base(BasesRecord(name="early", completed="2021-01-01"))
+    models.add_base(BasesRecord(name="late", completed="2022-01-01"))
+    models.add_base(BasesRecord(name="unknown"))
+    relational_model.select()
+    column = relational_model.fieldIndex("date_completed")
+
+    # When
+    filter_model.set_column_filter(column, ValueRange("2021-06-01"))
+
+    # Then
+    assert filter_model.rowCount() == 1
+    assert filter_model.index(0, 1).data() == "late"
+
+
+def test_range_filters_are_kept_in_saved_searches():
+    """Encoding and decoding the filters keeps ranges as ranges"""
+    # Given
+    filter_model = SortFilterModel()
+    filter_model.set_column_filter(3, ValueRange(None, 2.5))
+    filter_model.set_column_filter(1, ["foo"])
+    encoded = filter_model.encode_filters()
+
+    # When
+    decoded = SortFilterModel()
+    decoded.decode_filters(encoded)
+
+    # Then
+    assert decoded.get_column_filter(3) == ValueRange(None, 2.5)
+    assert decoded.get_column_filter(1) == ["foo"]
+
+
+def test_text_filter_survives_deleting_a_tag(context: Context, models: Models):
+    """Deleted tag names no longer match the filter text"""
+    # Given
+    tag_id = models.add_tag("Foo")
+    base_id = models.add_base(BasesRecord(name="base"))
+    models.add_tag_use(base_id, tag_id)
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    filter_model.setFilterKeyColumn(-1)
+    filter_model.setFilterFixedString("Foo")
+    assert filter_model.rowCount() == 1
+
+    # When
+    context.controller.delete_tag(context.models.tags_model.index_by_id(tag_id, "id"))
+
+    # Then
+    assert filter_model.rowCount() == 0
+
+
+def test_text_filter_survives_renaming_a_tag(
+    context: Context, models: Models, monkeypatch
+):
+    """Renamed tags match by their new name only"""
+    # Given
+    monkeypatch.setattr(QInputDialog, "getText", lambda *args, **kwargs: ("Bar", True))
+    tag_id = models.add_tag("Foo")
+    base_id = models.add_base(BasesRecord(name="base"))
+    models.add_tag_use(base_id, tag_id)
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(context.models.bases_model)
+    filter_model.setFilterKeyColumn(-1)
+    filter_model.setFilterFixedString("Foo")
+    assert filter_model.rowCount() == 1
+
+    # When
+    context.controller.rename_tag(context.models.tags_model.index_by_id(tag_id, "id"))
+    filter_model.setFilterFixedString("Bar")
+
+    # Then
+    assert filter_model.rowCount() == 1
+
+
+def test_snapshot_only_built_once_filtered(context: Context, models: Models):
+    """Selecting the bases leaves the snapshot to the first filter needing it"""
+    # Given
+    models.add_base(BasesRecord(name="foo"))
+    models.add_base(BasesRecord(name="bar"))
+    model = context.models.bases_model
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(model)
+    filter_model.setFilterKeyColumn(-1)
+    model.select()
+    assert filter_model.rowCount() == 2
+    assert model.snapshot is None
+
+    # When
+    filter_model.setFilterFixedString("foo")
+
+    # Then
+    assert model.snapshot is not None
+    assert filter_model.rowCount() == 1
+
+
+def test_proxy_rows_kept_when_source_rows_change(context: Context, models: Models):
+    """Rows added or deleted elsewhere leave the other filtered rows in place"""
+    # Given
+    model = context.models.bases_model
+    model.snapshot_enabled = True
+    foo_id = models.add_base(BasesRecord(name="Foo"))
+    bar_id = models.add_base(BasesRecord(name="Foo Bar"))
+    models.add_base(BasesRecord(name="Baz"))
+    filter_model = SortFilterModel()
+    filter_model.setSourceModel(model)
+    filter_model.setFilterKeyColumn(-1)
+    filter_model.setFilterFixedString("Foo")
+    current = QPersistentModelIndex(filter_model.index(1, 0))
+    resets = []
+    filter_model.modelReset.connect(lambda: resets.append(True))
+    context.database.execute_sql_command(f"DELETE FROM bases WHERE id = '{foo_id}';")
+    context.database.execute_sql_command(
+        "INSERT INTO bases (id, name) VALUES ('qux', 'Foo Qux');"
+    )
+
+    # When
+    model.apply_changes(RowChanges(inserted=["qux"], deleted=[foo_id]))
+
+    # Then
+    assert resets == []
+    assert current.isValid()
+    assert current.data() == bar_id
+    ids = [filter_model.index(row, 0).data() for row in range(filter_model.rowCount())]
+    assert ids == [bar_id, "qux"]
@@ -6,7 +6,10 @@ from pytest import MonkeyPatch
 from PyQt6.QtCore import QPoint, Qt
 from PyQt6.QtGui import QContextMenuEvent, QKeyEvent
 from PyQt6.QtWidgets import QMenu
-from adjutant.widgets.sort_filter_table import SortFilterTable
+from adjutant.widgets.sort_filter_table import (
+    SortFilterTable,
+    apply_field_to_index_list,
+)
 from adjutant.context import Context
 from tests.conftest import Models, BasesRecord
 
@@ -201,3 +204,29 @@ def test_other_keys_do_nothing(qtbot: QtBot, context: Context, models: Models):
             )
 
     # Then
+
+
+def test_apply_field_to_index_list_updates_rows(context: Context, models: Models):
+    """Applying a field updates the selected rows without resetting the model"""
+    # Given
+    models.add_base(BasesRecord(name="Foo"))
+    models.add_base(BasesRecord(name="Bar"))
+    models.add_base(BasesRecord(name="Baz"))
+    model = context.models.bases_model
+    name_field = model.fieldIndex("name")
+    resets = []
+    model.modelReset.connect(lambda: resets.append(True))
+
+    # When
+    apply_field_to_index_list(
+        model.index(0, name_field), [model.index(1, 0), model.index(2, 0)]
+    )
+
+    # Then
+    assert resets == []
+    assert model.isDirty() is False
+    assert [model.index(row, name_field).data() for row in range(3)] == [
+        "Foo",
+        "Foo",
+        "Foo",
+    ]
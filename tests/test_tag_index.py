@@ -0,0 +1,76 @@
+""" Tests for the TagIndex """
+
+from adjutant.context.dataclasses import Tag
+from adjutant.models.tag_index import TagIndex
+
+FOO = Tag("foo", "Foo")
+BAR = Tag("bar", "Bar")
+
+
+def test_load_builds_posting_lists():
+    """Every tag lists the bases that use it"""
+    # Given
+    index = TagIndex()
+
+    # When
+    index.load({"base1": (FOO, BAR), "base2": (FOO,)})
+
+    # Then
+    assert index.bases_for_tag("foo") == {"base1", "base2"}
+    assert index.bases_for_tag("bar") == {"base1"}
+    assert index.tags_for("base1") == (FOO, BAR)
+
+
+def test_set_tags_moves_base_between_postings():
+    """Replacing a base's tags updates only the affected posting lists"""
+    # Given
+    index = TagIndex()
+    index.load({"base1": (FOO,)})
+
+    # When
+    index.set_tags("base1", [BAR])
+
+    # Then
+    assert index.bases_for_tag("foo") == set()
+    assert index.bases_for_tag("bar") == {"base1"}
+
+
+def test_bases_with_all_intersects_postings():
+    """Only bases with every requested tag are returned"""
+    # Given
+    index = TagIndex()
+    index.load({"base1": (FOO, BAR), "base2": (FOO,), "base3": (BAR,)})
+
+    # When
+    bases = index.bases_with_all(["foo", "bar"])
+
+    # Then
+    assert bases == {"base1"}
+
+
+def test_rename_tags_drops_missing_tags():
+    """Tags missing from the names are removed, others are renamed"""
+    # Given
+    index = TagIndex()
+    index.load({"base1": (FOO, BAR)})
+
+    # When
+    index.rename_tags({"bar": "Baz"})
+
+    # Then
+    assert index.tags_for("base1") == (Tag("bar", "Baz"),)
+    assert index.bases_for_tag("foo") == set()
+
+
+def test_updated_tags_keeps_order_of_kept_tags():
+    """Kept tags stay in place, added tags follow them"""
+    # Given
+    index = TagIndex()
+    index.load({"base1": (FOO, BAR)})
+    baz = Tag("baz", "Baz")
+
+    # When
+    tags = index.updated_tags("base1", [baz, BAR])
+
+    # Then
+    assert tags == (BAR, baz)